@@ -0,0 +1,41 @@
+"""daily usage materialized view for analytics trends
+
+Revision ID: t12_1
+Revises: t11_1
+Create Date: 2026-10-16
+"""
+from alembic import op
+
+
+revision = "t12_1"
+down_revision = "t11_1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 每日 × 租戶彙總；/analytics/trends/daily 查此視圖（當日仍查原始表）
+    op.execute(
+        """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS mv_daily_usage AS
+        SELECT
+            CAST(created_at AS date) AS date,
+            tenant_id,
+            count(id) AS queries,
+            coalesce(sum(input_tokens), 0) AS input_tokens,
+            coalesce(sum(output_tokens), 0) AS output_tokens,
+            coalesce(sum(input_tokens + output_tokens), 0) AS total_tokens,
+            coalesce(sum(estimated_cost_usd), 0) AS cost
+        FROM usagerecords
+        GROUP BY 1, 2
+        """
+    )
+    # REFRESH ... CONCURRENTLY 需要唯一索引
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_mv_daily_usage_date_tenant "
+        "ON mv_daily_usage (date, tenant_id)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_daily_usage")
@@ -3,11 +3,12 @@
 提供跨租戶管理、平台統計、系統健康監控等功能
 """
 
+import json
 from typing import Any, List, Optional
 from uuid import UUID
 from datetime import datetime, timedelta
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import func, text
 from pydantic import BaseModel
@@ -546,12 +547,16 @@ def check_tenant_alerts(
     }
 
 
+# 方案配額是靜態設定：JSON 只序列化一次，之後每次請求直接回傳
+_PLAN_QUOTAS_JSON = json.dumps(PLAN_QUOTAS, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
 @router.get("/quota/plans")
 def list_plan_quotas(
     current_user: User = Depends(require_superuser),
 ) -> Any:
     """列出所有方案預設配額"""
-    return PLAN_QUOTAS
+    return Response(content=_PLAN_QUOTAS_JSON, media_type="application/json")
 
 
 # ═══════════════════════════════════════════
@@ -3,13 +3,15 @@
 提供圖表化趨勢、異常偵測、預算預警
 """
 
+import time
 from typing import Any, List, Optional
 from uuid import UUID
 from datetime import datetime, timedelta
 
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, Date
+from sqlalchemy import func, cast, Date, text, table, column
+from sqlalchemy.exc import ProgrammingError
 from pydantic import BaseModel
 
 from app.api import deps
@@ -71,6 +73,61 @@ class BudgetAlert(BaseModel):
 # ═══════════════════════════════════════════
 
 
+# 每日 × 租戶彙總物化視圖（migration t12_1，Celery beat 每 5 分鐘重新整理）
+_mv_daily_usage = table(
+    "mv_daily_usage",
+    column("date"),
+    column("tenant_id"),
+    column("queries"),
+    column("input_tokens"),
+    column("output_tokens"),
+    column("total_tokens"),
+    column("cost"),
+)
+
+
+# 視圖由 migration 建立 / 移除，滾動部署時可能晚於 worker 啟動：
+# 檢查結果只快取一段時間，查詢失敗時立即失效
+_DAILY_USAGE_VIEW_TTL = 60.0  # 秒
+_daily_usage_view_exists = False
+_daily_usage_view_checked_at = float("-inf")
+
+
+def _has_daily_usage_view(db: Session) -> bool:
+    # 未跑 migration 的環境（例如測試以 create_all 建表）沒有此視圖
+    global _daily_usage_view_exists, _daily_usage_view_checked_at
+    now = time.monotonic()
+    if now - _daily_usage_view_checked_at >= _DAILY_USAGE_VIEW_TTL:
+        _daily_usage_view_exists = bool(
+            db.execute(text("SELECT to_regclass('mv_daily_usage') IS NOT NULL")).scalar()
+        )
+        _daily_usage_view_checked_at = now
+    return _daily_usage_view_exists
+
+
+def _daily_usage_history(db: Session, start, today, tenant_id: Optional[UUID]) -> Optional[list]:
+    """從 mv_daily_usage 讀取 [start, today) 的每日彙總；視圖已不存在時回傳 None"""
+    global _daily_usage_view_checked_at
+    mv = _mv_daily_usage.c
+    hist = db.query(
+        mv.date,
+        func.sum(mv.queries).label("queries"),
+        func.sum(mv.input_tokens).label("input_tokens"),
+        func.sum(mv.output_tokens).label("output_tokens"),
+        func.sum(mv.total_tokens).label("total_tokens"),
+        func.sum(mv.cost).label("cost"),
+    ).filter(mv.date >= start, mv.date < today)
+    if tenant_id:
+        hist = hist.filter(mv.tenant_id == tenant_id)
+    try:
+        # SAVEPOINT：查詢失敗不會中止整個交易，之後仍可改走即時彙總
+        with db.begin_nested():
+            return hist.group_by(mv.date).order_by(mv.date).all()
+    except ProgrammingError:
+        _daily_usage_view_checked_at = float("-inf")
+        return None
+
+
 @router.get("/trends/daily", response_model=List[DailyUsage])
 def daily_usage_trend(
     tenant_id: Optional[UUID] = None,
@@ -81,8 +138,14 @@ def daily_usage_trend(
     """
     取得每日用量趨勢（最近 N 天）。
     若指定 tenant_id 則僅查該租戶；否則為全平台。
+    歷史日期讀 mv_daily_usage，當日仍即時彙總原始紀錄。
+    以整日為單位（從 N 天前的 0 點起），兩條路徑的結果一致。
     """
-    start = datetime.utcnow() - timedelta(days=days)
+    today = func.current_date()
+    start = today - days
+    hist_rows = _daily_usage_history(db, start, today, tenant_id) if _has_daily_usage_view(db) else None
+
+    # 有視圖時只即時彙總當日，否則彙總整個區間
     q = db.query(
         cast(UsageRecord.created_at, Date).label("date"),
         func.count(UsageRecord.id).label("queries"),
@@ -90,17 +153,19 @@ def daily_usage_trend(
         func.coalesce(func.sum(UsageRecord.output_tokens), 0).label("output_tokens"),
         func.coalesce(func.sum(UsageRecord.input_tokens + UsageRecord.output_tokens), 0).label("total_tokens"),
         func.coalesce(func.sum(UsageRecord.estimated_cost_usd), 0).label("cost"),
-    ).filter(UsageRecord.created_at >= start)
+    ).filter(UsageRecord.created_at >= (start if hist_rows is None else today))
 
     if tenant_id:
         q = q.filter(UsageRecord.tenant_id == tenant_id)
 
     rows = q.group_by(cast(UsageRecord.created_at, Date)).order_by(cast(UsageRecord.created_at, Date)).all()
+    if hist_rows is not None:
+        rows = hist_rows + rows
 
     return [
         DailyUsage(
             date=str(r.date),
-            queries=r.queries or 0,
+            queries=int(r.queries or 0),
             input_tokens=int(r.input_tokens or 0),
             output_tokens=int(r.output_tokens or 0),
             total_tokens=int(r.total_tokens or 0),
@@ -274,19 +339,24 @@ def detect_anomalies(
 
 @router.get("/budget-alerts", response_model=List[BudgetAlert])
 def budget_alerts(
+    tenant_id: Optional[UUID] = None,
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(require_superuser),
 ) -> Any:
     """
     全平台預算預警：列出所有配額接近上限或已超額的租戶。
+    若指定 tenant_id 則僅檢查該租戶。
     """
-    tenants = db.query(Tenant).filter(Tenant.status == "active").all()
+    q = db.query(Tenant).filter(Tenant.status == "active")
+    if tenant_id:
+        q = q.filter(Tenant.id == tenant_id)
+    tenants = q.all()
+    # 所有租戶的使用量以少數幾個 GROUP BY 查詢一次取得
+    quota_statuses = crud_tenant.get_quota_status_bulk(db, tenants)
     alerts = []
 
     for tenant in tenants:
-        status_data = crud_tenant.get_quota_status(db, tenant.id)
-        if not status_data:
-            continue
+        status_data = quota_statuses[tenant.id]
 
         ratio_keys = {
             "queries": (
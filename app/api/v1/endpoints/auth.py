@@ -35,6 +35,9 @@ _PASSWORD_MIN_LEN = 8
 _PASSWORD_MAX_LEN = 72  # bcrypt limit
 _NAME_MAX_LEN = 100
 _COMPANY_MAX_LEN = 200
+_HAS_LETTER_RE = re.compile(r"[A-Za-z]")
+_HAS_DIGIT_RE = re.compile(r"\d")
+_COMMON_PASSWORDS = frozenset({"password", "12345678", "qwerty12", "abcd1234", "password1", "admin123"})
 
 
 def _validate_password_strength(password: str) -> Optional[str]:
@@ -43,12 +46,11 @@ def _validate_password_strength(password: str) -> Optional[str]:
         return f"密碼至少需要 {_PASSWORD_MIN_LEN} 個字元"
     if len(password) > _PASSWORD_MAX_LEN:
         return f"密碼不可超過 {_PASSWORD_MAX_LEN} 個字元"
-    if not re.search(r"[A-Za-z]", password):
+    if not _HAS_LETTER_RE.search(password):
         return "密碼必須包含至少一個英文字母"
-    if not re.search(r"\d", password):
+    if not _HAS_DIGIT_RE.search(password):
         return "密碼必須包含至少一個數字"
-    common = {"password", "12345678", "qwerty12", "abcd1234", "password1", "admin123"}
-    if password.lower() in common:
+    if password.lower() in _COMMON_PASSWORDS:
         return "此密碼過於常見，請選擇更安全的密碼"
     return None
 
@@ -32,8 +32,17 @@ celery_app.conf.update(
     task_track_started=True,
 )
 
+# Periodic jobs (requires a `celery beat` process)
+celery_app.conf.beat_schedule = {
+    "refresh-daily-usage-view": {
+        "task": "analytics.refresh_daily_usage",
+        "schedule": 300.0,
+    },
+}
+
 # Auto-discover tasks so that @celery_app.task decorators in app/tasks/ get registered
 celery_app.autodiscover_tasks(["app.tasks"])
 
 # Explicitly import tasks to ensure they are registered
 import app.tasks.document_tasks  # noqa: F401, E402
+import app.tasks.analytics_tasks  # noqa: F401, E402
@@ -70,43 +70,71 @@ def _month_start() -> datetime:
 
 def get_current_usage(db: Session, tenant_id: UUID) -> Dict[str, Any]:
     """取得租戶目前使用量"""
-    month_start = _month_start()
+    return get_current_usage_bulk(db, [tenant_id])[tenant_id]
 
-    user_count = (
-        db.query(func.count(User.id)).filter(User.tenant_id == tenant_id, User.status == "active").scalar() or 0
-    )
 
-    doc_count = db.query(func.count(Document.id)).filter(Document.tenant_id == tenant_id).scalar() or 0
+def get_current_usage_bulk(db: Session, tenant_ids: List[UUID]) -> Dict[UUID, Dict[str, Any]]:
+    """批次取得多個租戶的目前使用量（每項指標一次 GROUP BY，而非每租戶各查一次）"""
+    if not tenant_ids:
+        return {}
+    month_start = _month_start()
 
-    # 月度查詢次數和 token 數
-    monthly = (
-        db.query(
+    user_counts = dict(
+        db.query(User.tenant_id, func.count(User.id))
+        .filter(User.tenant_id.in_(tenant_ids), User.status == "active")
+        .group_by(User.tenant_id)
+        .all()
+    )
+    doc_counts = dict(
+        db.query(Document.tenant_id, func.count(Document.id))
+        .filter(Document.tenant_id.in_(tenant_ids))
+        .group_by(Document.tenant_id)
+        .all()
+    )
+    monthly = {
+        r.tenant_id: r
+        for r in db.query(
+            UsageRecord.tenant_id,
             func.count(UsageRecord.id).label("queries"),
             func.coalesce(func.sum(UsageRecord.input_tokens + UsageRecord.output_tokens), 0).label("tokens"),
         )
         .filter(
-            UsageRecord.tenant_id == tenant_id,
+            UsageRecord.tenant_id.in_(tenant_ids),
             UsageRecord.created_at >= month_start,
         )
-        .first()
-    )
-
-    return {
-        "current_users": user_count,
-        "current_documents": doc_count,
-        "current_storage_mb": 0.0,  # TODO: 從文件大小累計
-        "current_monthly_queries": monthly.queries or 0,
-        "current_monthly_tokens": int(monthly.tokens or 0),
+        .group_by(UsageRecord.tenant_id)
+        .all()
     }
 
+    result = {}
+    for tid in tenant_ids:
+        m = monthly.get(tid)
+        result[tid] = {
+            "current_users": user_counts.get(tid, 0),
+            "current_documents": doc_counts.get(tid, 0),
+            "current_storage_mb": 0.0,  # TODO: 從文件大小累計
+            "current_monthly_queries": m.queries if m else 0,
+            "current_monthly_tokens": int(m.tokens) if m else 0,
+        }
+    return result
+
 
 def get_quota_status(db: Session, tenant_id: UUID) -> Dict[str, Any]:
     """取得租戶完整配額狀態（含使用量與使用率）"""
     tenant = get(db, tenant_id)
     if not tenant:
         return {}
+    return _build_quota_status(tenant, get_current_usage(db, tenant.id))
+
+
+def get_quota_status_bulk(db: Session, tenants: List[Tenant]) -> Dict[UUID, Dict[str, Any]]:
+    """批次版 get_quota_status：傳入已載入的租戶，回傳 {tenant_id: 配額狀態}"""
+    usages = get_current_usage_bulk(db, [t.id for t in tenants])
+    return {t.id: _build_quota_status(t, usages[t.id]) for t in tenants}
+
 
-    usage = get_current_usage(db, tenant_id)
+def _build_quota_status(tenant: Tenant, usage: Dict[str, Any]) -> Dict[str, Any]:
+    tenant_id = tenant.id
     warnings: List[str] = []
     is_over = False
     threshold = tenant.quota_alert_threshold or 0.8
@@ -172,7 +200,7 @@ def check_quota(db: Session, tenant_id: UUID, resource: str) -> Dict[str, Any]:
     if not tenant:
         return {"allowed": False, "message": "租戶不存在"}
 
-    usage = get_current_usage(db, tenant_id)
+    usage = get_current_usage(db, tenant.id)
 
     checks = {
         "user": (usage["current_users"], tenant.max_users, "使用者數量"),
@@ -25,11 +25,12 @@ import json
 import time
 import logging
 import socket
+import functools
 import ipaddress
 from io import StringIO
 from typing import List, Tuple, Dict, Any, Optional
 from pathlib import Path
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field, fields, asdict, MISSING
 from urllib.parse import urlparse
 
 # ── 必要依賴 ──
@@ -268,6 +269,18 @@ class QualityReport:
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
 
+    def reset(self, **values):
+        """就地重設為預設值（清單清空而非重建），可同時指定新值"""
+        for f in fields(self):
+            if f.default_factory is not MISSING:
+                getattr(self, f.name).clear()
+            else:
+                setattr(self, f.name, f.default)
+        for name, value in values.items():
+            if not hasattr(self, name):
+                raise TypeError(f"QualityReport 沒有欄位 {name!r}")
+            setattr(self, name, value)
+
     def add_warning(self, msg: str):
         self.warnings.append(msg)
 
@@ -1479,13 +1492,13 @@ class TextChunker:
     - 重疊區保留上下文
     """
 
-    _encoder = None
-
-    @classmethod
-    def _get_encoder(cls):
-        if cls._encoder is None and _HAS_TIKTOKEN:
-            cls._encoder = tiktoken.encoding_for_model("gpt-3.5-turbo")
-        return cls._encoder
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _get_encoder():
+        # 編碼器載入成本高（首次需下載 BPE 檔），整個行程只建立一次
+        if _HAS_TIKTOKEN:
+            return tiktoken.encoding_for_model("gpt-3.5-turbo")
+        return None
 
     @classmethod
     def count_tokens(cls, text: str) -> int:
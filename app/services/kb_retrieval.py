@@ -14,6 +14,7 @@ UniHR 進階知識庫檢索服務 (Advanced Knowledge Base Retriever)
 import hashlib
 import json
 import logging
+import re
 from typing import List, Dict, Any, Optional
 from uuid import UUID
 
@@ -72,6 +73,9 @@ import time as _time
 _BM25_CACHE: Dict[str, Dict[str, Any]] = {}  # tenant_id → {bm25, chunks, doc_map, built_at}
 _BM25_CACHE_TTL = 300  # 5 分鐘 TTL（安全網）
 
+# 無 jieba 時的分詞：CJK 逐字，其餘英數字（str.isalnum）連續成詞
+_FALLBACK_TOKEN_RE = re.compile(r"[\u4e00-\u9fff]|[^\W_\u4e00-\u9fff]+")
+
 
 class KnowledgeBaseRetriever:
     """
@@ -492,23 +496,7 @@ class KnowledgeBaseRetriever:
             return [t.strip().lower() for t in tokens if t.strip() and len(t.strip()) > 0]
 
         # Fallback：逐字 + 英文按詞
-        tokens: List[str] = []
-        current_word = ""
-        for char in text:
-            if "\u4e00" <= char <= "\u9fff":
-                if current_word:
-                    tokens.append(current_word.lower())
-                    current_word = ""
-                tokens.append(char)
-            elif char.isalnum():
-                current_word += char
-            else:
-                if current_word:
-                    tokens.append(current_word.lower())
-                    current_word = ""
-        if current_word:
-            tokens.append(current_word.lower())
-        return [t for t in tokens if len(t.strip()) > 0]
+        return [t.lower() for t in _FALLBACK_TOKEN_RE.findall(text)]
 
     # ─────────────────────────────────────────────
     # 混合檢索（RRF 融合）
@@ -0,0 +1,33 @@
+"""
+Analytics rollup refresh (Celery beat)
+
+mv_daily_usage（migration t12_1）每 5 分鐘重新整理一次，
+供 /api/v1/analytics/trends/daily 查詢歷史日期。
+"""
+
+import logging
+
+from sqlalchemy import text
+
+from app.celery_app import celery_app
+from app.db.session import create_session
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name="analytics.refresh_daily_usage")
+def refresh_daily_usage_view_task():
+    """CONCURRENTLY：重新整理期間查詢不會被阻擋。"""
+    db = create_session(bypass=True)
+    try:
+        if not db.execute(text("SELECT to_regclass('mv_daily_usage')")).scalar():
+            logger.warning("mv_daily_usage not found; run alembic upgrade")
+            return
+        db.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_daily_usage"))
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to refresh mv_daily_usage")
+        raise
+    finally:
+        db.close()
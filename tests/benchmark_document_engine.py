@@ -14,12 +14,17 @@ UniHR 文件處理引擎 — 綜合能力評估 (Benchmark & Self-Evaluation)
 每項評估給出 0-100 分，最終產出綜合報告。
 """
 
+import bisect
+import io
 import os
+import re
 import sys
+import threading
 import time
 import json
 import tempfile
 import statistics
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Dict
 
@@ -49,8 +54,11 @@ class BenchmarkResult:
 
 results: List[BenchmarkResult] = []
 
+# 平行執行時，每個 stage 執行緒各自收集結果與輸出，結束後依原順序合併
+_stage_local = threading.local()
+
 def bench(category: str, name: str, score: float, max_score: float, detail: str = ""):
-    results.append(BenchmarkResult(category, name, score, max_score, detail))
+    getattr(_stage_local, "results", results).append(BenchmarkResult(category, name, score, max_score, detail))
     status = "✓" if score >= max_score else ("△" if score >= max_score * 0.7 else "✗")
     pct = score / max_score * 100 if max_score > 0 else 0
     print(f"  {status} [{pct:5.1f}%] {name}: {score}/{max_score}  {detail}")
@@ -504,8 +512,8 @@ def eval_chunking_quality():
         min_tokens = min(token_counts)
         
         # 最大 chunk 不應超過 chunk_size 太多（允許 10% 容差）
-        over_limit = sum(1 for t in token_counts if t > chunk_size * 1.1)
-        under_30 = sum(1 for t in token_counts if t < 30)
+        over_limit = sum(t > chunk_size * 1.1 for t in token_counts)
+        under_30 = sum(t < 30 for t in token_counts)
         
         score = 10
         details = [f"chunks={len(chunks)}", f"avg={avg:.0f}", f"stdev={stdev:.0f}",
@@ -557,7 +565,7 @@ def eval_chunking_quality():
     
     chunks = TextChunker.split_by_tokens(heading_text, chunk_size=50, chunk_overlap=10)
     # 每個 chunk 應該以標題開始或包含完整章節
-    heading_starts = sum(1 for c in chunks if c.strip().startswith("#"))
+    heading_starts = sum(c.strip().startswith("#") for c in chunks)
     score = min(10, heading_starts * 3) if chunks else 0
     bench("C.切片", "標題邊界切分", score, 10,
           f"以標題開頭的chunk={heading_starts}/{len(chunks)}")
@@ -628,7 +636,7 @@ def eval_tokenizer():
             hits = 1 if not tokens else 0
             total_hits = 1
         else:
-            hits = sum(1 for e in expected if e in tokens)
+            hits = sum(e in tokens for e in expected)
             total_hits = len(expected)
         
         # 額外檢查：不應有空白 token
@@ -704,7 +712,7 @@ def eval_retrieval_architecture():
     sig = inspect.signature(KnowledgeBaseRetriever.search)
     params = list(sig.parameters.keys())
     expected_params = ["self", "tenant_id", "query", "top_k", "mode", "min_score", "rerank", "use_cache"]
-    found = sum(1 for p in expected_params if p in params)
+    found = sum(p in params for p in expected_params)
     score = found / len(expected_params) * 10
     bench("E.檢索", "search() 參數完整", score, 10, f"{found}/{len(expected_params)} 參數")
 
@@ -807,6 +815,48 @@ def eval_performance():
 # G. 企業覆蓋率 — 常見場景驗證
 # ═══════════════════════════════════════════════════════════
 
+# G2/G4 關鍵詞：以單一 regex 聯集一次掃描全文，取代逐詞 `in` 多次掃描
+_HR_TERM_GROUPS = (
+    ("員工手冊",),
+    ("勞動基準法",),
+    ("八小時",),
+    ("NT$2,400", "2,400", "2400"),
+    ("特休天數", "特別休假"),
+)
+_SALARY_TERM_GROUPS = (
+    ("員工編號",), ("姓名",),
+    ("E0001",), ("E0050",),
+    ("工程部",), ("人事部",),
+)
+
+
+def _compile_terms(groups) -> "re.Pattern[str]":
+    # 長詞優先，避免 "2,400" 先吃掉 "NT$2,400"
+    terms = sorted({t for g in groups for t in g}, key=len, reverse=True)
+    return re.compile("|".join(map(re.escape, terms)))
+
+
+_HR_TERMS_RE = _compile_terms(_HR_TERM_GROUPS)
+_SALARY_TERMS_RE = _compile_terms(_SALARY_TERM_GROUPS)
+_ARTICLE_RE = re.compile(r"第(\d+)條")
+_CHAPTERS = ("第一章", "第二章", "第三章", "第四章", "第五章")
+
+# G3/G4 測試資料：依 i % 3 查表，取代三段式條件運算
+_LAW_SENTENCES = (
+    "勞工工作年資自受僱之日起算。",
+    "前項規定於試用期間亦適用之。",
+    "違反前條規定者，處新臺幣二萬元以上三十萬元以下罰鍰。",
+)
+_SALARY_DEPTS = ("工程", "人事", "財務")
+_SALARY_TITLES = ("工程師", "專員", "會計")
+
+
+def _term_checks(pattern: "re.Pattern[str]", groups, text: str) -> List[bool]:
+    """單次掃描 text，回傳每組關鍵詞是否至少出現一個"""
+    found = set(pattern.findall(text))
+    return [any(t in found for t in g) for g in groups]
+
+
 def eval_enterprise_coverage():
     print("\n" + "=" * 64)
     print("G. 企業覆蓋率 — 常見情境能力")
@@ -826,7 +876,7 @@ def eval_enterprise_coverage():
         "JSON 資料": ".json",
         "圖片掃描": ".jpg",
     }
-    covered = sum(1 for ext in enterprise_formats.values() if ext in SUPPORTED_FORMATS)
+    covered = sum(ext in SUPPORTED_FORMATS for ext in enterprise_formats.values())
     score = covered / len(enterprise_formats) * 10
     bench("G.覆蓋", "企業格式覆蓋", score, 10,
           f"{covered}/{len(enterprise_formats)} 格式支援")
@@ -874,14 +924,11 @@ def eval_enterprise_coverage():
             path = f.name
         text, meta = DocumentParser.parse(path, "markdown")
         
-        # 解析品質
-        checks_parse = [
-            "員工手冊" in text,
-            "勞動基準法" in text,
-            "八小時" in text,
-            "NT$2,400" in text or "2,400" in text or "2400" in text,
-            "特休天數" in text or "特別休假" in text,
-        ]
+        # 解析品質；原文本身包含所有關鍵詞，解析結果與原文相同時可直接判定通過
+        if text == hr_doc:
+            checks_parse = [True] * len(_HR_TERM_GROUPS)
+        else:
+            checks_parse = _term_checks(_HR_TERMS_RE, _HR_TERM_GROUPS, text)
         parse_score = sum(checks_parse) / len(checks_parse) * 10
         bench("G.覆蓋", "HR文件解析完整", parse_score, 10,
               f"{sum(checks_parse)}/{len(checks_parse)} 關鍵資訊")
@@ -889,14 +936,12 @@ def eval_enterprise_coverage():
         # 切片品質
         chunks = TextChunker.split_by_tokens(text, chunk_size=300, chunk_overlap=50)
         chunk_score = 0
+        chapter_covered = set()
         if chunks:
-            # 各章節是否被合理切分
-            chapter_covered = set()
-            for c in chunks:
-                for ch in ["第一章", "第二章", "第三章", "第四章", "第五章"]:
-                    if ch in c:
-                        chapter_covered.add(ch)
-            coverage = len(chapter_covered) / 5
+            # 各章節是否被合理切分；以分隔字元串接 chunks，避免跨 chunk 邊界誤判
+            joined = "\x00".join(chunks)
+            chapter_covered = {ch for ch in _CHAPTERS if ch in joined}
+            coverage = len(chapter_covered) / len(_CHAPTERS)
             chunk_score = coverage * 10
         bench("G.覆蓋", "HR文件切片覆蓋", chunk_score, 10,
               f"章節覆蓋={len(chapter_covered)}/5, chunks={len(chunks)}")
@@ -907,10 +952,7 @@ def eval_enterprise_coverage():
         bench("G.覆蓋", "HR文件切片覆蓋", 0, 10, f"例外: {e}")
 
     # G3: 法規文件（長文、多條文）
-    law_text = "\n".join([
-        f"第{i}條 {'勞工工作年資自受僱之日起算。' if i%3==0 else '前項規定於試用期間亦適用之。' if i%3==1 else '違反前條規定者，處新臺幣二萬元以上三十萬元以下罰鍰。'}"
-        for i in range(1, 101)
-    ])
+    law_text = "\n".join(f"第{i}條 {_LAW_SENTENCES[i % 3]}" for i in range(1, 101))
     try:
         with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, mode="w", encoding="utf-8") as f:
             f.write(law_text)
@@ -919,7 +961,8 @@ def eval_enterprise_coverage():
         chunks = TextChunker.split_by_tokens(text, chunk_size=500, chunk_overlap=80)
         
         # 驗證：100 條法規都被保留
-        articles_found = sum(1 for i in range(1, 101) if f"第{i}條" in text)
+        article_nums = {int(m) for m in _ARTICLE_RE.findall(text)}
+        articles_found = sum(i in article_nums for i in range(1, 101))
         score = articles_found / 100 * 10
         bench("G.覆蓋", "法規文件(100條)", score, 10,
               f"保留={articles_found}/100條, chunks={len(chunks)}")
@@ -930,18 +973,14 @@ def eval_enterprise_coverage():
     # G4: 薪資報表 (CSV)
     salary_csv = "員工編號,姓名,部門,職稱,本薪,加班費,總計\n"
     for i in range(1, 51):
-        salary_csv += f"E{i:04d},員工{i:02d},{'工程' if i%3==0 else '人事' if i%3==1 else '財務'}部,{'工程師' if i%3==0 else '專員' if i%3==1 else '會計'},{40000+i*500},{i*200},{40000+i*500+i*200}\n"
+        salary_csv += f"E{i:04d},員工{i:02d},{_SALARY_DEPTS[i % 3]}部,{_SALARY_TITLES[i % 3]},{40000+i*500},{i*200},{40000+i*500+i*200}\n"
     try:
         with tempfile.NamedTemporaryFile(suffix=".csv", delete=False, mode="w", encoding="utf-8") as f:
             f.write(salary_csv)
             path = f.name
         text, meta = DocumentParser.parse(path, "csv")
-        checks = [
-            "員工編號" in text, "姓名" in text,
-            "E0001" in text, "E0050" in text,
-            "工程部" in text, "人事部" in text,
-            meta.get("tables_detected", 0) >= 1,
-        ]
+        checks = _term_checks(_SALARY_TERMS_RE, _SALARY_TERM_GROUPS, text)
+        checks.append(meta.get("tables_detected", 0) >= 1)
         score = sum(checks) / len(checks) * 10
         bench("G.覆蓋", "薪資報表CSV(50人)", score, 10, f"{sum(checks)}/{len(checks)} 內容完整")
         os.unlink(path)
@@ -972,19 +1011,31 @@ def eval_enterprise_coverage():
 # 綜合報告
 # ═══════════════════════════════════════════════════════════
 
+_GRADE_THRESHOLDS = (60, 70, 80, 85, 90, 95)
+_GRADES = ("F", "D", "C", "B", "B+", "A", "A+")
+
+
+def _grade(pct: float) -> str:
+    """百分比 → 等級 (>=95 A+, >=90 A, ... <60 F)"""
+    return _GRADES[bisect.bisect_right(_GRADE_THRESHOLDS, pct)]
+
+
 def generate_report():
     print("\n")
     print("╔" + "═" * 62 + "╗")
     print("║         UniHR 文件處理引擎 — 綜合能力評估報告              ║")
     print("╠" + "═" * 62 + "╣")
 
-    # 按類別彙總
+    # 按類別彙總，同一輪順便收集失敗項 (<70%) 與滿分項
     categories: Dict[str, List[BenchmarkResult]] = {}
+    failures: List[BenchmarkResult] = []
+    perfect: List[BenchmarkResult] = []
     for r in results:
-        cat = r.category
-        if cat not in categories:
-            categories[cat] = []
-        categories[cat].append(r)
+        categories.setdefault(r.category, []).append(r)
+        if r.score < r.max_score * 0.7:
+            failures.append(r)
+        if r.score >= r.max_score:
+            perfect.append(r)
 
     total_score = 0
     total_max = 0
@@ -999,7 +1050,7 @@ def generate_report():
 
         bar_len = int(pct / 5)
         bar = "█" * bar_len + "░" * (20 - bar_len)
-        grade = "A+" if pct >= 95 else "A" if pct >= 90 else "B+" if pct >= 85 else "B" if pct >= 80 else "C" if pct >= 70 else "D" if pct >= 60 else "F"
+        grade = _grade(pct)
         
         cat_summaries.append((cat, pct, grade, bar, len(items)))
         print(f"║  {cat:<12} {bar} {pct:5.1f}%  ({grade})  [{len(items)}項]  ║")
@@ -1007,20 +1058,18 @@ def generate_report():
     print("╠" + "═" * 62 + "╣")
 
     overall = total_score / total_max * 100 if total_max > 0 else 0
-    overall_grade = "A+" if overall >= 95 else "A" if overall >= 90 else "B+" if overall >= 85 else "B" if overall >= 80 else "C" if overall >= 70 else "D" if overall >= 60 else "F"
+    overall_grade = _grade(overall)
     bar = "█" * int(overall / 5) + "░" * (20 - int(overall / 5))
     print(f"║  {'綜合分數':<12} {bar} {overall:5.1f}%  ({overall_grade})  [{len(results)}項]  ║")
     print("╚" + "═" * 62 + "╝")
 
     # 失敗項列表
-    failures = [r for r in results if r.score < r.max_score * 0.7]
     if failures:
         print(f"\n⚠ 需改善項目 ({len(failures)} 項):")
         for r in failures:
             print(f"  ✗ [{r.category}] {r.name}: {r.score}/{r.max_score} — {r.detail}")
 
     # 優秀項
-    perfect = [r for r in results if r.score >= r.max_score]
     print(f"\n✓ 滿分項目: {len(perfect)}/{len(results)} ({len(perfect)/len(results)*100:.0f}%)")
 
     # 能力總結
@@ -1062,6 +1111,60 @@ def generate_report():
     return overall
 
 
+# ═══════════════════════════════════════════════════════════
+# Stage 執行
+# ═══════════════════════════════════════════════════════════
+
+class _StageStdout:
+    """stage 執行緒的 print 寫入各自緩衝區，其他執行緒照常輸出"""
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, s: str) -> int:
+        return getattr(_stage_local, "buffer", self._stream).write(s)
+
+    def flush(self) -> None:
+        getattr(_stage_local, "buffer", self._stream).flush()
+
+    def __getattr__(self, name):
+        # encoding / isatty / fileno 等其餘屬性交給真正的 stdout
+        return getattr(self._stream, name)
+
+
+def _run_stage(fn):
+    _stage_local.results = []
+    _stage_local.buffer = io.StringIO()
+    try:
+        fn()
+        return _stage_local.results, _stage_local.buffer.getvalue()
+    finally:
+        del _stage_local.results, _stage_local.buffer
+
+
+def run_stages(stages, serial=()):
+    """
+    平行執行 stages（解析 / 切片多為 I/O 與釋放 GIL 的原生呼叫），
+    serial 內的計時型 stage 等執行緒池結束後再單獨執行，避免量測被干擾。
+    結果與輸出依 stages 原順序合併，與逐一執行相同。
+    """
+    parallel = [fn for fn in stages if fn not in serial]
+    real_stdout = sys.stdout
+    sys.stdout = _StageStdout(real_stdout)
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(parallel), os.cpu_count() or 1)) as ex:
+            futures = {fn: ex.submit(_run_stage, fn) for fn in parallel}
+        outputs = {fn: fut.result() for fn, fut in futures.items()}
+        for fn in serial:
+            outputs[fn] = _run_stage(fn)
+    finally:
+        sys.stdout = real_stdout
+
+    for fn in stages:
+        stage_results, text = outputs[fn]
+        results.extend(stage_results)
+        sys.stdout.write(text)
+
+
 # ═══════════════════════════════════════════════════════════
 # 主程式
 # ═══════════════════════════════════════════════════════════
@@ -1072,12 +1175,18 @@ if __name__ == "__main__":
     print("  日期: 2026-02-06")
     print("=" * 64)
 
-    eval_parsing_correctness()
-    eval_edge_cases()
-    eval_chunking_quality()
-    eval_tokenizer()
-    eval_retrieval_architecture()
-    eval_performance()
-    eval_enterprise_coverage()
+    run_stages(
+        [
+            eval_parsing_correctness,
+            eval_edge_cases,
+            eval_chunking_quality,
+            eval_tokenizer,
+            eval_retrieval_architecture,
+            eval_performance,
+            eval_enterprise_coverage,
+        ],
+        # B2 超大文件與 F 效能基準含計時，需獨佔 CPU
+        serial=(eval_edge_cases, eval_performance),
+    )
     
     overall = generate_report()
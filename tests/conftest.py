@@ -1,14 +1,24 @@
 """Pytest configuration and fixtures for integration tests."""
 import asyncio
 import os
+import threading
 import uuid
+import orjson
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
 import pytest
 from httpx import AsyncClient, ASGITransport
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 from app.db.base_class import Base
 
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
 # --- Constants ---
 SUPERUSER_EMAIL = "superuser@test.com"
 SUPERUSER_PASSWORD = "Super123!"
@@ -32,62 +42,103 @@ def _build_test_db_url() -> str:
     )
 
 
+def _worker_schema():
+    """
+    Private schema for this pytest-xdist worker (``test_gw0``, ...), or None
+    when running without xdist. Workers share one test database, so each one
+    creates/drops its tables in its own schema instead of racing on public.
+    """
+    worker = os.getenv("PYTEST_XDIST_WORKER")
+    return f"test_{worker}" if worker else None
+
+
 # --- Session-level fixtures ---
 
 @pytest.fixture(scope="session")
 def event_loop():
-    """Create event loop for async tests."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
+    """Create event loop for async tests (uvloop when installed)."""
+    loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     yield loop
+    asyncio.set_event_loop(None)
     loop.close()
 
 
-@pytest.fixture(scope="session")
-def test_engine():
-    """Create a SQLAlchemy engine for the test database (session scope)."""
-    engine = create_engine(_build_test_db_url())
-    yield engine
-    engine.dispose()
+@pytest.fixture(scope="session", autouse=True)
+def _fast_bcrypt():
+    """Drop bcrypt to its minimum cost (4) for the test session only."""
+    from app.core.security import pwd_context
 
+    original = pwd_context.to_dict()
+    pwd_context.update(bcrypt__rounds=4)
+    yield
+    pwd_context.load(original)
 
-# --- Per-test fixtures ---
 
-@pytest.fixture(scope="function")
-async def client(test_engine):
+@pytest.fixture(scope="session", autouse=True)
+def _stub_document_task():
     """
-    Create async HTTP client with proper DB dependency override.
-    Each test gets:
-      - Fresh tables (create_all / drop_all)
-      - get_db overridden to use the test database
-      - A pre-seeded superuser for admin operations
+    Uploads never reach Celery: enqueueing process_document_task (the upload
+    endpoint uses apply_async) returns a stub result instead of talking to
+    the broker.
+    """
+    from app.tasks.document_tasks import process_document_task
+
+    def _enqueue(*args, **kwargs):
+        return SimpleNamespace(id="test-task-id")
+
+    with patch.object(process_document_task, "apply_async", _enqueue), \
+            patch.object(process_document_task, "delay", _enqueue):
+        yield
+
+
+@pytest.fixture(scope="session")
+def test_engine():
+    """
+    Create a SQLAlchemy engine for the test database (session scope).
+    Tables are created once here; per-test isolation comes from the
+    transaction rollback in ``client`` rather than drop_all/create_all.
     """
-    from app.main import app as fastapi_app
-    from app.api.deps import get_db
-    from app.core.security import get_password_hash
     # Import all models so Base.metadata knows every table
     import app.models  # noqa: F401
 
-    TestSession = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+    schema = _worker_schema()
+    if schema is None:
+        engine = create_engine(_build_test_db_url())
+    else:
+        # public stays on the path for extensions (pgvector)
+        engine = create_engine(
+            _build_test_db_url(),
+            connect_args={"options": f"-csearch_path={schema},public"},
+        )
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+            conn.execute(text(f'CREATE SCHEMA "{schema}"'))
 
-    # Create all tables
-    Base.metadata.create_all(bind=test_engine)
+    # The worker schema starts empty; checkfirst would see tables left in public
+    Base.metadata.create_all(bind=engine, checkfirst=schema is None)
+    yield engine
+    if schema is None:
+        Base.metadata.drop_all(bind=engine)
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+    engine.dispose()
 
-    # Override get_db
-    def _override_get_db():
-        db = TestSession()
-        try:
-            yield db
-        finally:
-            db.close()
 
-    fastapi_app.dependency_overrides[get_db] = _override_get_db
+@pytest.fixture(scope="session")
+def _superuser_token(test_engine) -> str:
+    """
+    Seed the platform tenant + superuser once (committed, so it survives the
+    per-test rollback) and return a JWT for it. The token is minted the same
+    way the login endpoint does, which skips a bcrypt verify per test.
+    """
+    from app.core.security import create_access_token, get_password_hash
+    from app.models.tenant import Tenant
+    from app.models.user import User
 
-    # Seed a platform tenant + superuser
-    db = TestSession()
+    db = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)()
     try:
-        from app.models.tenant import Tenant
-        from app.models.user import User
-
         platform_tenant = Tenant(
             id=uuid.uuid4(),
             name="Platform",
@@ -112,57 +163,252 @@ async def client(test_engine):
     finally:
         db.close()
 
-    transport = ASGITransport(app=fastapi_app)
-    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+    # Outlive the default 30-minute expiry so long suite runs keep working
+    return create_access_token(SUPERUSER_EMAIL, expires_delta=timedelta(hours=12))
+
+
+@pytest.fixture(scope="session")
+def _transport() -> ASGITransport:
+    """One in-process ASGI transport for the whole session (it holds no per-test state)."""
+    from app.main import app as fastapi_app
+
+    return ASGITransport(app=fastapi_app)
+
+
+@pytest.fixture(scope="session")
+async def _http_client(_transport):
+    """
+    One AsyncClient for the whole session; per-test state is reset in ``client``.
+    Requests never leave the process, so httpx's timeout bookkeeping is off.
+    """
+    async with AsyncClient(transport=_transport, base_url="http://test", timeout=None) as ac:
         yield ac
 
-    # Teardown
+
+def _session_factory(bind) -> sessionmaker:
+    """Sessions that join the caller's transaction; commit() only releases a SAVEPOINT."""
+    return sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=bind,
+        join_transaction_mode="create_savepoint",
+    )
+
+
+def _serialized_get_db(session_factory: sessionmaker):
+    """
+    get_db override for sessions that all share one connection. A request
+    holds the lock from session open to close, so requests fired concurrently
+    (asyncio.gather) take turns on the connection instead of interleaving.
+    """
+    lock = threading.Lock()
+
+    def _override_get_db():
+        with lock:
+            db = session_factory()
+            try:
+                yield db
+            finally:
+                db.close()
+
+    return _override_get_db
+
+
+# --- Module-level fixtures ---
+
+@pytest.fixture(scope="module")
+def _db_connection(test_engine):
+    """
+    One connection per test module, inside an outer transaction that is
+    rolled back when the module finishes. Module-scoped seed data lives here;
+    each test adds its own SAVEPOINT on top (see ``client``).
+    """
+    connection = test_engine.connect()
+    outer_trans = connection.begin()
+    yield connection
+    outer_trans.rollback()
+    connection.close()
+
+
+@pytest.fixture(scope="module")
+def seed_tenant_users(_db_connection):
+    """
+    Factory: ``seed_tenant_users(tax_id, roles=("owner",), plan=None, name=None)``
+    -> (tenant_json, {role: auth_headers}), one ``{role}@{tax_id}.com`` user per role.
+
+    Goes through the same CRUD calls as POST /tenants and POST /users, but
+    without HTTP, and mints each user's JWT instead of logging in. Called from
+    a module-scoped fixture the rows live for the whole module; called inside
+    a test they are rolled back with that test.
+    """
+    from app.core.security import create_access_token
+    from app.crud import crud_tenant, crud_user
+    from app.schemas.tenant import Tenant as TenantSchema, TenantCreate
+    from app.schemas.user import UserCreate
+
+    Session = _session_factory(_db_connection)
+
+    def _seed(tax_id: str, roles=("owner",), plan: str = None, name: str = None,
+              password: str = "Test123!"):
+        tid = tax_id.lower()  # EmailStr normalizes domain to lowercase
+        db = Session()
+        try:
+            tenant = crud_tenant.create(
+                db, obj_in=TenantCreate(name=name or f"Co {tax_id}", plan=plan),
+            )
+            headers = {}
+            for role in roles:
+                email = f"{role}@{tid}.com"
+                crud_user.create(db, obj_in=UserCreate(
+                    email=email, password=password,
+                    full_name=role.title(), role=role,
+                    tenant_id=tenant.id,
+                ))
+                headers[role] = {"Authorization": f"Bearer {create_access_token(email)}"}
+            tenant_json = TenantSchema.model_validate(tenant).model_dump(mode="json")
+        finally:
+            db.close()
+        return tenant_json, headers
+
+    return _seed
+
+
+@pytest.fixture(scope="module")
+def seed_tenant_owner(seed_tenant_users):
+    """Factory: ``seed_tenant_owner(tax_id)`` -> (tenant_json, owner_headers)."""
+
+    def _seed(tax_id: str, password: str = "Owner123!"):
+        tenant_json, headers = seed_tenant_users(tax_id, password=password)
+        return tenant_json, headers["owner"]
+
+    return _seed
+
+
+@pytest.fixture(scope="module")
+def seed_via_api(_db_connection, _superuser_token, _http_client, event_loop):
+    """
+    Runner for module-level seeding through the API:
+    ``seed_via_api(async_fn)`` awaits ``async_fn(client)`` on the session loop.
+    Writes land in the module transaction, so every test in the module sees
+    them and they are rolled back when the module finishes.
+    """
+    from app.main import app as fastapi_app
+    from app.api.deps import get_db
+
+    def _seed(async_fn):
+        fastapi_app.dependency_overrides[get_db] = _serialized_get_db(_session_factory(_db_connection))
+        try:
+            return event_loop.run_until_complete(async_fn(_http_client))
+        finally:
+            fastapi_app.dependency_overrides.clear()
+            _http_client.cookies.clear()
+
+    return _seed
+
+
+# --- Per-test fixtures ---
+
+@pytest.fixture(scope="function")
+async def client(_db_connection, _superuser_token, _http_client):
+    """
+    Session-wide async HTTP client with a per-test DB dependency override.
+    Each test gets:
+      - A SAVEPOINT on the module connection, rolled back at teardown
+      - get_db overridden to use the test database; app-level commit()
+        only releases a nested SAVEPOINT
+      - A pre-seeded superuser for admin operations
+      - An empty cookie jar (cleared after every test)
+    """
+    from app.main import app as fastapi_app
+    from app.api.deps import get_db
+
+    test_trans = _db_connection.begin_nested()
+    fastapi_app.dependency_overrides[get_db] = _serialized_get_db(_session_factory(_db_connection))
+
+    yield _http_client
+
+    # Teardown: cookies set by a login must not leak into the next test
+    _http_client.cookies.clear()
     fastapi_app.dependency_overrides.clear()
-    Base.metadata.drop_all(bind=test_engine)
+    if test_trans.is_active:
+        test_trans.rollback()
 
 
-@pytest.fixture
-async def superuser_headers(client: AsyncClient):
-    """Get Authorization headers for the pre-seeded superuser."""
-    login = await client.post(
-        "/api/v1/auth/login/access-token",
-        data={"username": SUPERUSER_EMAIL, "password": SUPERUSER_PASSWORD},
-    )
-    assert login.status_code == 200, f"Superuser login failed: {login.text}"
-    # Cookie-based auth: extract token from response cookie, use Bearer fallback
-    token = login.cookies.get("unihr_access") or login.json().get("access_token")
-    assert token, "No access token in cookies or body"
-    # Clear client cookies so per-request Bearer headers take precedence
-    client.cookies.clear()
-    return {"Authorization": f"Bearer {token}"}
+@pytest.fixture(scope="session")
+def superuser_headers(_superuser_token: str) -> dict:
+    """Authorization headers for the pre-seeded superuser (session-cached JWT)."""
+    return {"Authorization": f"Bearer {_superuser_token}"}
 
 
 # --- Helpers ---
 
+def j(resp):
+    """Decode a response body with orjson (faster than httpx's stdlib-json ``.json()``)."""
+    return orjson.loads(resp.content)
+
+
+class StubOrchestrator:
+    """Stand-in for ChatOrchestrator on POST /chat/chat: process_query returns ``result``."""
+
+    __slots__ = ("result",)
+
+    def __init__(self, result):
+        self.result = result
+
+    async def process_query(self, *args, **kwargs):
+        return self.result
+
+
+async def gather_settled(*aws):
+    """
+    asyncio.gather that lets every call finish before re-raising the first
+    error. Plain gather raises while the other requests are still using the
+    shared connection, and the test's SAVEPOINT rollback then races them.
+    """
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return results
+
+
 async def create_tenant(client: AsyncClient, headers: dict, data: dict) -> dict:
     """Helper: create a tenant via API and return its JSON."""
     resp = await client.post("/api/v1/tenants/", json=data, headers=headers)
     assert resp.status_code == 200, f"Create tenant failed: {resp.text}"
-    return resp.json()
+    return j(resp)
 
 
 async def create_user(client: AsyncClient, headers: dict, data: dict) -> dict:
     """Helper: create a user via API and return its JSON."""
     resp = await client.post("/api/v1/users/", json=data, headers=headers)
     assert resp.status_code == 200, f"Create user failed: {resp.text}"
-    return resp.json()
+    return j(resp)
+
+
+# (email, password) -> auth headers from the first successful login this session.
+# Tokens only carry the email and are resolved per request, so they stay valid
+# when a later test re-creates the same user. A test that changes a password
+# must drop its entry.
+_login_cache: dict = {}
 
 
 async def login_user(client: AsyncClient, email: str, password: str) -> dict:
-    """Helper: login and return auth headers."""
+    """Helper: login and return auth headers (cached per email/password)."""
+    cached = _login_cache.get((email, password))
+    if cached is not None:
+        return dict(cached)
+
     resp = await client.post(
         "/api/v1/auth/login/access-token",
         data={"username": email, "password": password},
     )
     assert resp.status_code == 200, f"Login failed for {email}: {resp.text}"
     # Cookie-based auth: extract token from response cookie, use Bearer fallback
-    token = resp.cookies.get("unihr_access") or resp.json().get("access_token")
+    token = resp.cookies.get("unihr_access") or j(resp).get("access_token")
     assert token, f"No access token for {email}"
     # Clear client cookies so per-request Bearer headers take precedence
     client.cookies.clear()
-    return {"Authorization": f"Bearer {token}"}
+    headers = {"Authorization": f"Bearer {token}"}
+    _login_cache[(email, password)] = headers
+    return dict(headers)
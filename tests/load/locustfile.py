@@ -25,6 +25,8 @@ UniHR SaaS 負載測試腳本 — Locust
 import os
 import random
 import string
+import threading
+import time
 from locust import HttpUser, task, between, tag, events
 from locust.runners import MasterRunner
 
@@ -38,6 +40,10 @@ USER_EMAIL = os.getenv("LOAD_TEST_USER_EMAIL", "user@example.com")
 USER_PASSWORD = os.getenv("LOAD_TEST_USER_PASSWORD", "user123")
 SUPERUSER_EMAIL = os.getenv("LOAD_TEST_SUPERUSER_EMAIL", "superadmin@example.com")
 SUPERUSER_PASSWORD = os.getenv("LOAD_TEST_SUPERUSER_PASSWORD", "superadmin123")
+# 快取的 JWT 在此秒數後重新登入（需小於 ACCESS_TOKEN_EXPIRE_MINUTES）
+TOKEN_TTL_SECONDS = int(os.getenv("LOAD_TEST_TOKEN_TTL_SECONDS", "1500"))
+# 登入失敗也快取此秒數，避免錯誤帳密讓每個虛擬使用者都重試
+FAILED_LOGIN_RETRY_SECONDS = 5
 
 
 # ---------------------------------------------------------------------------
@@ -54,10 +60,93 @@ PERFORMANCE_BASELINES = {
 }
 
 
+# ---------------------------------------------------------------------------
+# 題庫（模組層級常數，task 內不再重建 list）
+# ---------------------------------------------------------------------------
+_REGULAR_QUESTIONS = (
+    "請問特休怎麼計算？",
+    "加班費的計算方式？",
+    "員工離職預告期是多長？",
+    "產假有幾天？薪水怎麼算？",
+    "勞基法規定的工時上限？",
+    "資遣費計算方式？",
+    "試用期有法律規定嗎？",
+    "哺乳時間相關規定？",
+)
+_KB_QUERIES = (
+    "特休假",
+    "加班",
+    "離職",
+    "請假規定",
+    "勞工保險",
+)
+_ADMIN_QUESTIONS = (
+    "員工違反工作規則怎麼處理？",
+    "如何合法解僱員工？",
+    "勞動檢查要準備什麼？",
+)
+
+
 def _random_string(length: int = 8) -> str:
     return "".join(random.choices(string.ascii_lowercase, k=length))
 
 
+# ---------------------------------------------------------------------------
+# JWT 快取：同一組帳密在所有虛擬使用者間共用，避免每次 spawn 都打 bcrypt
+# ---------------------------------------------------------------------------
+_TOKEN_CACHE: dict = {}  # (email, password) -> (token, issued_at)；token 為 "" 表示登入失敗
+_TOKEN_LOCKS: dict = {}  # (email, password) -> Lock：同帳密只由一個使用者登入
+_TOKEN_LOCKS_GUARD = threading.Lock()
+
+
+def _cached_token(key):
+    """未過期的快取 token（失敗為 ""）；沒有或已過期回傳 None"""
+    cached = _TOKEN_CACHE.get(key)
+    if cached is None:
+        return None
+    token, issued_at = cached
+    ttl = TOKEN_TTL_SECONDS if token else FAILED_LOGIN_RETRY_SECONDS
+    return token if time.monotonic() - issued_at < ttl else None
+
+
+def _get_token(client, email: str, password: str) -> str:
+    """取得（或重用）指定帳密的 access token；登入失敗回傳空字串"""
+    key = (email, password)
+    token = _cached_token(key)
+    if token is not None:
+        return token
+
+    # 只鎖同一組帳密：其他帳密的使用者不必排隊等這次登入
+    with _TOKEN_LOCKS_GUARD:
+        lock = _TOKEN_LOCKS.setdefault(key, threading.Lock())
+    with lock:
+        # 等待期間可能已有其他使用者登入完成
+        token = _cached_token(key)
+        if token is not None:
+            return token
+
+        resp = client.post(
+            "/api/v1/auth/login/access-token",
+            data={"username": email, "password": password},
+            name="auth_login",
+        )
+        token = ""
+        if resp.status_code == 200:
+            # Cookie-based auth：token 在 HttpOnly cookie，body 為舊版相容
+            token = resp.cookies.get("unihr_access") or resp.json().get("access_token", "")
+        _TOKEN_CACHE[key] = (token, time.monotonic())
+        return token
+
+
+def _authenticate(user: HttpUser, email: str, password: str) -> None:
+    """登入並將 Authorization header 一次設定到 session 上"""
+    user.token = _get_token(user.client, email, password)
+    # 以 Bearer header 為準，避免 session cookie 與快取 token 不一致
+    user.client.cookies.clear()
+    if user.token:
+        user.client.headers["Authorization"] = f"Bearer {user.token}"
+
+
 # ---------------------------------------------------------------------------
 # 一般使用者行為
 # ---------------------------------------------------------------------------
@@ -69,37 +158,16 @@ class RegularUser(HttpUser):
 
     def on_start(self):
         """登入取得 JWT Token"""
-        resp = self.client.post(
-            "/api/v1/auth/login",
-            data={"username": USER_EMAIL, "password": USER_PASSWORD},
-            name="auth_login",
-        )
-        if resp.status_code == 200:
-            self.token = resp.json().get("access_token", "")
-            self.headers = {"Authorization": f"Bearer {self.token}"}
-        else:
-            self.token = ""
-            self.headers = {}
+        _authenticate(self, USER_EMAIL, USER_PASSWORD)
 
     # ----- Chat -----
     @tag("chat")
     @task(5)
     def chat_send_message(self):
         """送出聊天訊息（最高頻操作）"""
-        questions = [
-            "請問特休怎麼計算？",
-            "加班費的計算方式？",
-            "員工離職預告期是多長？",
-            "產假有幾天？薪水怎麼算？",
-            "勞基法規定的工時上限？",
-            "資遣費計算方式？",
-            "試用期有法律規定嗎？",
-            "哺乳時間相關規定？",
-        ]
         self.client.post(
             "/api/v1/chat/",
-            json={"question": random.choice(questions)},
-            headers=self.headers,
+            json={"question": random.choice(_REGULAR_QUESTIONS)},
             name="chat_send",
             timeout=30,
         )
@@ -111,7 +179,6 @@ class RegularUser(HttpUser):
         """列出文件清單"""
         self.client.get(
             "/api/v1/documents/",
-            headers=self.headers,
             name="document_list",
         )
 
@@ -120,17 +187,9 @@ class RegularUser(HttpUser):
     @task(3)
     def search_knowledge_base(self):
         """知識庫搜尋"""
-        queries = [
-            "特休假",
-            "加班",
-            "離職",
-            "請假規定",
-            "勞工保險",
-        ]
         self.client.get(
             "/api/v1/kb/search",
-            params={"q": random.choice(queries), "top_k": 5},
-            headers=self.headers,
+            params={"q": random.choice(_KB_QUERIES), "top_k": 5},
             name="kb_search",
         )
 
@@ -141,7 +200,6 @@ class RegularUser(HttpUser):
         """查看個人資料"""
         self.client.get(
             "/api/v1/users/me",
-            headers=self.headers,
             name="user_profile",
         )
 
@@ -152,7 +210,6 @@ class RegularUser(HttpUser):
         """列出對話記錄"""
         self.client.get(
             "/api/v1/chat/conversations",
-            headers=self.headers,
             name="chat_conversations_list",
         )
 
@@ -163,7 +220,6 @@ class RegularUser(HttpUser):
         """查看訂閱方案"""
         self.client.get(
             "/api/v1/subscription/current",
-            headers=self.headers,
             name="subscription_current",
         )
 
@@ -178,17 +234,7 @@ class HRAdminUser(HttpUser):
     weight = 2  # 20% 管理者
 
     def on_start(self):
-        resp = self.client.post(
-            "/api/v1/auth/login",
-            data={"username": ADMIN_EMAIL, "password": ADMIN_PASSWORD},
-            name="auth_login",
-        )
-        if resp.status_code == 200:
-            self.token = resp.json().get("access_token", "")
-            self.headers = {"Authorization": f"Bearer {self.token}"}
-        else:
-            self.token = ""
-            self.headers = {}
+        _authenticate(self, ADMIN_EMAIL, ADMIN_PASSWORD)
 
     @tag("documents")
     @task(3)
@@ -205,7 +251,6 @@ class HRAdminUser(HttpUser):
         self.client.post(
             "/api/v1/documents/upload",
             files=files,
-            headers=self.headers,
             name="document_upload",
         )
 
@@ -214,7 +259,6 @@ class HRAdminUser(HttpUser):
     def list_documents(self):
         self.client.get(
             "/api/v1/documents/",
-            headers=self.headers,
             name="document_list",
         )
 
@@ -225,7 +269,6 @@ class HRAdminUser(HttpUser):
         self.client.get(
             "/api/v1/audit/logs",
             params={"skip": 0, "limit": 20},
-            headers=self.headers,
             name="audit_logs",
         )
 
@@ -235,7 +278,6 @@ class HRAdminUser(HttpUser):
         """查看用量摘要"""
         self.client.get(
             "/api/v1/audit/usage/summary",
-            headers=self.headers,
             name="audit_usage_summary",
         )
 
@@ -245,22 +287,15 @@ class HRAdminUser(HttpUser):
         """取得公司品牌設定"""
         self.client.get(
             "/api/v1/company/branding",
-            headers=self.headers,
             name="company_branding",
         )
 
     @tag("chat")
     @task(2)
     def chat_send_message(self):
-        questions = [
-            "員工違反工作規則怎麼處理？",
-            "如何合法解僱員工？",
-            "勞動檢查要準備什麼？",
-        ]
         self.client.post(
             "/api/v1/chat/",
-            json={"question": random.choice(questions)},
-            headers=self.headers,
+            json={"question": random.choice(_ADMIN_QUESTIONS)},
             name="chat_send",
             timeout=30,
         )
@@ -276,17 +311,7 @@ class PlatformAdmin(HttpUser):
     weight = 1  # 10%
 
     def on_start(self):
-        resp = self.client.post(
-            "/api/v1/auth/login",
-            data={"username": SUPERUSER_EMAIL, "password": SUPERUSER_PASSWORD},
-            name="auth_login",
-        )
-        if resp.status_code == 200:
-            self.token = resp.json().get("access_token", "")
-            self.headers = {"Authorization": f"Bearer {self.token}"}
-        else:
-            self.token = ""
-            self.headers = {}
+        _authenticate(self, SUPERUSER_EMAIL, SUPERUSER_PASSWORD)
 
     @tag("admin")
     @task(3)
@@ -294,7 +319,6 @@ class PlatformAdmin(HttpUser):
         """平台總覽 Dashboard"""
         self.client.get(
             "/api/v1/admin/dashboard",
-            headers=self.headers,
             name="admin_dashboard",
         )
 
@@ -304,7 +328,6 @@ class PlatformAdmin(HttpUser):
         """列出所有租戶"""
         self.client.get(
             "/api/v1/admin/tenants",
-            headers=self.headers,
             name="admin_tenants_list",
         )
 
@@ -314,7 +337,6 @@ class PlatformAdmin(HttpUser):
         """系統健康檢查"""
         self.client.get(
             "/api/v1/admin/system/health",
-            headers=self.headers,
             name="admin_system_health",
         )
 
@@ -325,7 +347,6 @@ class PlatformAdmin(HttpUser):
         self.client.get(
             "/api/v1/analytics/trends/daily",
             params={"days": 7},
-            headers=self.headers,
             name="analytics_daily_trends",
         )
 
@@ -335,7 +356,6 @@ class PlatformAdmin(HttpUser):
         """異常偵測"""
         self.client.get(
             "/api/v1/analytics/anomalies",
-            headers=self.headers,
             name="analytics_anomalies",
         )
 
@@ -345,7 +365,6 @@ class PlatformAdmin(HttpUser):
         """預算告警"""
         self.client.get(
             "/api/v1/analytics/budget-alerts",
-            headers=self.headers,
             name="analytics_budget_alerts",
         )
 
@@ -373,6 +392,25 @@ class HealthChecker(HttpUser):
 # ---------------------------------------------------------------------------
 # 事件 Hook：測試結束時輸出效能基準線比對
 # ---------------------------------------------------------------------------
+def _response_time_percentiles(entry, percents) -> dict:
+    """
+    一次由大到小走訪 response_times 直方圖，同時求出多個百分位數
+    （語意同 locust 的 calculate_response_time_percentile）
+    """
+    num_requests = entry.num_requests
+    pending = sorted(percents, reverse=True)
+    result = {p: 0 for p in percents}
+    processed_count = 0
+    for response_time, count in sorted(entry.response_times.items(), reverse=True):
+        processed_count += count
+        remaining = num_requests - processed_count
+        while pending and remaining <= int(num_requests * pending[0]):
+            result[pending.pop(0)] = response_time
+        if not pending:
+            break
+    return result
+
+
 @events.quitting.add_listener
 def on_quitting(environment, **kwargs):
     """測試結束時比對效能基準線，並輸出結果"""
@@ -392,8 +430,9 @@ def on_quitting(environment, **kwargs):
             print(f"  ⚪ {name:30s}  — 無資料（未觸發）")
             continue
 
-        p95 = entry.get_response_time_percentile(0.95) or 0
-        p99 = entry.get_response_time_percentile(0.99) or 0
+        percentiles = _response_time_percentiles(entry, (0.95, 0.99))
+        p95 = percentiles[0.95]
+        p99 = percentiles[0.99]
         error_rate = entry.fail_ratio
 
         status_p95 = "✅" if p95 <= baseline["p95"] else "❌"
@@ -1,55 +1,75 @@
 """
 Phase 3 Integration Tests — Rate Limiting & Analytics (T3-4, T3-5)
 """
+from types import MappingProxyType
+
 import pytest
 from httpx import AsyncClient
-from unittest.mock import patch, AsyncMock
-from tests.conftest import create_tenant, create_user, login_user
+from unittest.mock import patch
+from sqlalchemy import text
+from app.api.v1.endpoints import analytics
+from tests.conftest import StubOrchestrator, gather_settled, j
+
+pytestmark = pytest.mark.asyncio
 
 CHAT_URL = "/api/v1/chat/chat"
 ORCH_CLASS = "app.api.v1.endpoints.chat.ChatOrchestrator"
 
 
-def _mock_orchestrator():
-    result = {
-        "request_id": "r", "question": "q", "answer": "a",
-        "company_policy": None, "labor_law": None,
-        "sources": [], "notes": [], "disclaimer": "僅供參考",
-    }
-    inst = AsyncMock()
-    inst.process_query = AsyncMock(return_value=result)
-    return patch(ORCH_CLASS, return_value=inst)
-
-
-async def _setup(client, superuser_headers, tax_id):
-    tid = tax_id.lower()  # EmailStr normalizes domain to lowercase
-    t = await create_tenant(client, superuser_headers, {
-        "name": f"Co {tax_id}", "tax_id": tax_id,
-        "contact_name": "C", "contact_email": f"c@{tid}.com",
-        "contact_phone": f"09{tax_id}",
-    })
-    await create_user(client, superuser_headers, {
-        "email": f"owner@{tid}.com", "password": "Owner123!",
-        "full_name": "Owner", "role": "owner",
-        "tenant_id": t["id"],
-    })
-    h = await login_user(client, f"owner@{tid}.com", "Owner123!")
-    return t, h
+# 唯讀：chat 端點只讀取結果，所有呼叫共用同一份
+_MOCK_RESULT = MappingProxyType({
+    "request_id": "r", "question": "q", "answer": "a",
+    "company_policy": None, "labor_law": None,
+    "sources": [], "notes": [], "disclaimer": "僅供參考",
+})
+_MOCK_ORCH = StubOrchestrator(_MOCK_RESULT)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _patched_orchestrator():
+    """整個模組只 patch 一次 ChatOrchestrator"""
+    with patch(ORCH_CLASS, return_value=_MOCK_ORCH):
+        yield
+
+
+# 唯讀測試共用 RO01；會寫入租戶狀態的測試各自一個租戶
+_TAX_IDS = ("RO01", "DT01", "DT02", "MC01", "BA01", "SC02", "MV01")
+
+
+@pytest.fixture(scope="module")
+def owner_ctx(seed_tenant_owner):
+    """每個模組只建立一次租戶 + owner：{tax_id: (tenant, owner_headers)}"""
+    return {tax_id: seed_tenant_owner(tax_id) for tax_id in _TAX_IDS}
+
+
+# 趨勢 / 成本測試所需的聊天紀錄
+_SEED_CHATS = (("DT01", "trend q"), ("DT02", "tenant trend"), ("MC01", "cost q"))
+
+
+@pytest.fixture(scope="module")
+def seeded_chats(owner_ctx, seed_via_api):
+    """模組開始時一次並行送出所有聊天，各測試只需查詢分析 API"""
+    async def _post_all(ac):
+        resps = await gather_settled(*(
+            ac.post(CHAT_URL, headers=owner_ctx[tax_id][1], json={"question": q})
+            for tax_id, q in _SEED_CHATS
+        ))
+        for (tax_id, _), r in zip(_SEED_CHATS, resps):
+            assert r.status_code == 200, f"{tax_id}: {r.status_code} {r.text}"
+
+    seed_via_api(_post_all)
 
 
 # ── T3-5: Cost Analytics ──
 
-@pytest.mark.asyncio
-async def test_daily_usage_trend(client: AsyncClient, superuser_headers: dict):
+@pytest.mark.usefixtures("seeded_chats")
+async def test_daily_usage_trend(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試每日用量趨勢 API"""
-    t, h = await _setup(client, superuser_headers, "DT01")
-
-    with _mock_orchestrator():
-        await client.post(CHAT_URL, headers=h, json={"question": "trend q"})
+    t, _ = owner_ctx["DT01"]
 
     r = await client.get("/api/v1/analytics/trends/daily?days=7", headers=superuser_headers)
     assert r.status_code == 200
-    data = r.json()
+    data = j(r)
     assert isinstance(data, list)
     if data:
         assert "date" in data[0]
@@ -57,13 +77,10 @@ async def test_daily_usage_trend(client: AsyncClient, superuser_headers: dict):
         assert "cost" in data[0]
 
 
-@pytest.mark.asyncio
-async def test_daily_trend_per_tenant(client: AsyncClient, superuser_headers: dict):
+@pytest.mark.usefixtures("seeded_chats")
+async def test_daily_trend_per_tenant(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試單一租戶每日趨勢"""
-    t, h = await _setup(client, superuser_headers, "DT02")
-
-    with _mock_orchestrator():
-        await client.post(CHAT_URL, headers=h, json={"question": "tenant trend"})
+    t, _ = owner_ctx["DT02"]
 
     r = await client.get(
         f"/api/v1/analytics/trends/daily?tenant_id={t['id']}&days=7",
@@ -72,43 +89,102 @@ async def test_daily_trend_per_tenant(client: AsyncClient, superuser_headers: di
     assert r.status_code == 200
 
 
-@pytest.mark.asyncio
-async def test_monthly_cost_by_tenant(client: AsyncClient, superuser_headers: dict):
+# 與 migration t12_1 相同的定義；測試 schema 由 create_all 建立，沒有此視圖
+_CREATE_MV_DAILY_USAGE = text("""
+    CREATE MATERIALIZED VIEW mv_daily_usage AS
+    SELECT
+        CAST(created_at AS date) AS date,
+        tenant_id,
+        count(id) AS queries,
+        coalesce(sum(input_tokens), 0) AS input_tokens,
+        coalesce(sum(output_tokens), 0) AS output_tokens,
+        coalesce(sum(input_tokens + output_tokens), 0) AS total_tokens,
+        coalesce(sum(estimated_cost_usd), 0) AS cost
+    FROM usagerecords
+    GROUP BY 1, 2
+""")
+
+
+async def test_daily_trend_view_matches_live(
+    client: AsyncClient, superuser_headers: dict, owner_ctx: dict, _db_connection, monkeypatch,
+):
+    """測試物化視圖路徑（歷史 + 當日即時）與即時彙總結果一致"""
+    t, _ = owner_ctx["MV01"]
+    # 當日、昨日、3 天前 ×2、視窗第一天 00:01（邊界）、視窗外
+    _db_connection.execute(text("""
+        INSERT INTO usagerecords
+            (id, tenant_id, action_type, input_tokens, output_tokens, estimated_cost_usd, created_at)
+        SELECT gen_random_uuid(), :tid, 'chat', 10, 5, 0.01, ts
+        FROM unnest(ARRAY[
+            now(),
+            now() - interval '1 day',
+            now() - interval '3 days',
+            now() - interval '3 days',
+            current_date - 7 + time '00:01',
+            now() - interval '30 days'
+        ]::timestamptz[]) AS ts
+    """), {"tid": t["id"]})
+    url = f"/api/v1/analytics/trends/daily?tenant_id={t['id']}&days=7"
+
+    def expire():
+        # 強制下次請求重新偵測視圖（模擬快取過期）
+        monkeypatch.setattr(analytics, "_daily_usage_view_checked_at", float("-inf"))
+
+    monkeypatch.setattr(analytics, "_daily_usage_view_exists", False)
+
+    expire()
+    live = await client.get(url, headers=superuser_headers)
+    assert live.status_code == 200
+    assert analytics._daily_usage_view_exists is False
+    assert [d["queries"] for d in j(live)] == [1, 2, 1, 1]
+
+    # 視圖建立後（例如滾動部署中跑完 migration），快取過期即改走視圖路徑
+    _db_connection.execute(_CREATE_MV_DAILY_USAGE)
+    expire()
+    via_view = await client.get(url, headers=superuser_headers)
+    assert via_view.status_code == 200
+    assert analytics._daily_usage_view_exists is True
+    assert j(via_view) == j(live)
+
+    # 快取仍為 True 時視圖被移除：改走即時彙總，並讓快取失效
+    _db_connection.execute(text("DROP MATERIALIZED VIEW mv_daily_usage"))
+    dropped = await client.get(url, headers=superuser_headers)
+    assert dropped.status_code == 200
+    assert j(dropped) == j(live)
+    assert analytics._daily_usage_view_checked_at == float("-inf")
+
+
+@pytest.mark.usefixtures("seeded_chats")
+async def test_monthly_cost_by_tenant(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試各租戶月度成本排行"""
-    t, h = await _setup(client, superuser_headers, "MC01")
-
-    with _mock_orchestrator():
-        await client.post(CHAT_URL, headers=h, json={"question": "cost q"})
+    t, _ = owner_ctx["MC01"]
 
     r = await client.get("/api/v1/analytics/trends/monthly-by-tenant", headers=superuser_headers)
     assert r.status_code == 200
-    data = r.json()
+    data = j(r)
     assert isinstance(data, list)
     if data:
         assert "tenant_name" in data[0]
         assert "total_cost" in data[0]
 
 
-@pytest.mark.asyncio
 async def test_anomaly_detection(client: AsyncClient, superuser_headers: dict):
     """測試異常偵測 API"""
     r = await client.get("/api/v1/analytics/anomalies", headers=superuser_headers)
     assert r.status_code == 200
-    assert isinstance(r.json(), list)
+    assert isinstance(j(r), list)
 
 
-@pytest.mark.asyncio
 async def test_budget_alerts(client: AsyncClient, superuser_headers: dict):
     """測試預算預警 API"""
     r = await client.get("/api/v1/analytics/budget-alerts", headers=superuser_headers)
     assert r.status_code == 200
-    assert isinstance(r.json(), list)
+    assert isinstance(j(r), list)
 
 
-@pytest.mark.asyncio
-async def test_budget_alerts_detects_exceeded(client: AsyncClient, superuser_headers: dict):
+async def test_budget_alerts_detects_exceeded(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試預算預警能偵測超額租戶"""
-    t, h = await _setup(client, superuser_headers, "BA01")
+    t, h = owner_ctx["BA01"]
 
     # 設定極低配額
     await client.put(
@@ -117,34 +193,34 @@ async def test_budget_alerts_detects_exceeded(client: AsyncClient, superuser_hea
         json={"monthly_query_limit": 1},
     )
 
-    with _mock_orchestrator():
-        await client.post(CHAT_URL, headers=h, json={"question": "q"})
+    await client.post(CHAT_URL, headers=h, json={"question": "q"})
 
-    r = await client.get("/api/v1/analytics/budget-alerts", headers=superuser_headers)
+    r = await client.get(
+        "/api/v1/analytics/budget-alerts",
+        headers=superuser_headers,
+        params={"tenant_id": t["id"]},
+    )
     assert r.status_code == 200
-    data = r.json()
-    # 應有至少一個此租戶的告警
-    tenant_alerts = [a for a in data if a["tenant_id"] == t["id"]]
-    assert len(tenant_alerts) >= 1
-    assert tenant_alerts[0]["alert_type"] in ("warning", "exceeded")
+    data = j(r)
+    # 應有至少一個告警，且只回傳此租戶
+    assert data and data[0]["alert_type"] in ("warning", "exceeded")
+    assert all(a["tenant_id"] == t["id"] for a in data)
 
 
 # ── T3-3: Security Isolation Config ──
 
-@pytest.mark.asyncio
-async def test_get_default_security_config(client: AsyncClient, superuser_headers: dict):
+async def test_get_default_security_config(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試取得預設安全組態"""
-    t, _ = await _setup(client, superuser_headers, "SC01")
+    t, _ = owner_ctx["RO01"]
 
     r = await client.get(f"/api/v1/admin/tenants/{t['id']}/security", headers=superuser_headers)
     assert r.status_code == 200
-    assert r.json()["isolation_level"] == "standard"
+    assert j(r)["isolation_level"] == "standard"
 
 
-@pytest.mark.asyncio
-async def test_update_security_config(client: AsyncClient, superuser_headers: dict):
+async def test_update_security_config(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試更新安全組態"""
-    t, _ = await _setup(client, superuser_headers, "SC02")
+    t, _ = owner_ctx["SC02"]
 
     r = await client.put(
         f"/api/v1/admin/tenants/{t['id']}/security",
@@ -156,16 +232,15 @@ async def test_update_security_config(client: AsyncClient, superuser_headers: di
         },
     )
     assert r.status_code == 200
-    data = r.json()
+    data = j(r)
     assert data["isolation_level"] == "enhanced"
     assert data["require_mfa"] is True
     assert "192.168.1.0" in data["ip_whitelist"]
 
 
-@pytest.mark.asyncio
-async def test_invalid_isolation_level_rejected(client: AsyncClient, superuser_headers: dict):
+async def test_invalid_isolation_level_rejected(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試無效隔離等級被拒絕"""
-    t, _ = await _setup(client, superuser_headers, "SC03")
+    t, _ = owner_ctx["RO01"]
 
     r = await client.put(
         f"/api/v1/admin/tenants/{t['id']}/security",
@@ -4,7 +4,7 @@ Validates the security hardening implemented per SECURITY_ASSESSMENT_2026-03-23.
 """
 import pytest
 from httpx import AsyncClient
-from tests.conftest import SUPERUSER_EMAIL, SUPERUSER_PASSWORD
+from tests.conftest import SUPERUSER_EMAIL, SUPERUSER_PASSWORD, j
 
 ACCESS_COOKIE = "unihr_access"
 REFRESH_COOKIE = "unihr_refresh"
@@ -31,7 +31,7 @@ async def test_login_sets_httponly_cookies(client: AsyncClient):
     assert resp.status_code == 200
 
     # Response body must NOT contain access_token
-    body = resp.json()
+    body = j(resp)
     assert body.get("access_token") is None
     assert body["token_type"] == "bearer"
 
@@ -52,7 +52,7 @@ async def test_cookie_auth_works_for_protected_endpoint(client: AsyncClient):
     # client cookie jar now has the access cookie
     resp = await client.get(ME_URL)
     assert resp.status_code == 200
-    data = resp.json()
+    data = j(resp)
     assert data["email"] == SUPERUSER_EMAIL
 
 
@@ -70,7 +70,7 @@ async def test_bearer_header_fallback_still_works(client: AsyncClient):
     client.cookies.clear()
     resp = await client.get(ME_URL, headers={"Authorization": f"Bearer {token}"})
     assert resp.status_code == 200
-    assert resp.json()["email"] == SUPERUSER_EMAIL
+    assert j(resp)["email"] == SUPERUSER_EMAIL
 
 
 # ────────────────────────────────────────
@@ -88,7 +88,7 @@ async def test_csrf_required_for_unsafe_method_with_cookies(client: AsyncClient)
     # Try a state-changing endpoint that requires auth
     resp = await client.post(LOGOUT_URL)
     assert resp.status_code == 403
-    assert "CSRF" in resp.json().get("detail", "")
+    assert "CSRF" in j(resp).get("detail", "")
 
 
 @pytest.mark.asyncio
@@ -183,7 +183,7 @@ async def test_logout_clears_cookies(client: AsyncClient):
 
     resp = await client.post(LOGOUT_URL, headers={CSRF_HEADER: csrf_token})
     assert resp.status_code == 200
-    assert resp.json()["msg"] == "Logged out"
+    assert j(resp)["msg"] == "Logged out"
 
     # After logout, /me should fail
     me_resp = await client.get(ME_URL)
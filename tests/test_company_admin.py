@@ -1,81 +1,80 @@
 """
 Phase 3 Integration Tests — Tenant Self-Service (T3-2)
 """
+from types import MappingProxyType
+
 import pytest
 from httpx import AsyncClient
-from unittest.mock import patch, AsyncMock
-from tests.conftest import create_tenant, create_user, login_user
+from unittest.mock import patch
+from tests.conftest import StubOrchestrator, create_user, login_user, j
+
+pytestmark = pytest.mark.asyncio
 
 CHAT_URL = "/api/v1/chat/chat"
 ORCH_CLASS = "app.api.v1.endpoints.chat.ChatOrchestrator"
 
 
-def _mock_orchestrator():
-    result = {
-        "request_id": "r", "question": "q", "answer": "a",
-        "company_policy": None, "labor_law": None,
-        "sources": [], "notes": [], "disclaimer": "僅供參考",
-    }
-    inst = AsyncMock()
-    inst.process_query = AsyncMock(return_value=result)
-    return patch(ORCH_CLASS, return_value=inst)
+# 唯讀：chat 端點只讀取結果，所有呼叫共用同一份
+_MOCK_RESULT = MappingProxyType({
+    "request_id": "r", "question": "q", "answer": "a",
+    "company_policy": None, "labor_law": None,
+    "sources": [], "notes": [], "disclaimer": "僅供參考",
+})
+_MOCK_ORCH = StubOrchestrator(_MOCK_RESULT)
 
 
-async def _setup(client, superuser_headers, tax_id):
-    tid = tax_id.lower()  # EmailStr normalizes domain to lowercase
-    t = await create_tenant(client, superuser_headers, {
-        "name": f"Co {tax_id}", "tax_id": tax_id,
-        "contact_name": "C", "contact_email": f"c@{tid}.com",
-        "contact_phone": f"09{tax_id}",
-    })
-    await create_user(client, superuser_headers, {
-        "email": f"owner@{tid}.com", "password": "Owner123!",
-        "full_name": "Owner", "role": "owner",
-        "tenant_id": t["id"],
-    })
-    h = await login_user(client, f"owner@{tid}.com", "Owner123!")
-    return t, h
+@pytest.fixture(scope="module", autouse=True)
+def _patched_orchestrator():
+    """整個模組只 patch 一次 ChatOrchestrator"""
+    with patch(ORCH_CLASS, return_value=_MOCK_ORCH):
+        yield
+
+
+# 唯讀測試共用 RO01；會寫入租戶狀態的測試各自一個租戶
+_TAX_IDS = ("RO01", "IU01", "UR01", "DU01", "EC01", "US01", "UU01")
+
+
+@pytest.fixture(scope="module")
+def owner_ctx(seed_tenant_owner):
+    """每個模組只建立一次租戶 + owner：{tax_id: (tenant, owner_headers)}"""
+    return {tax_id: seed_tenant_owner(tax_id) for tax_id in _TAX_IDS}
 
 
-@pytest.mark.asyncio
-async def test_company_dashboard(client: AsyncClient, superuser_headers: dict):
+async def test_company_dashboard(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試公司儀表板"""
-    t, h = await _setup(client, superuser_headers, "CD01")
+    t, h = owner_ctx["RO01"]
 
     r = await client.get("/api/v1/company/dashboard", headers=h)
     assert r.status_code == 200
-    data = r.json()
-    assert data["company_name"] == "Co CD01"
+    data = j(r)
+    assert data["company_name"] == "Co RO01"
     assert "quota_status" in data
     assert data["user_count"] >= 1
 
 
-@pytest.mark.asyncio
-async def test_company_profile(client: AsyncClient, superuser_headers: dict):
+async def test_company_profile(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試公司資訊查看"""
-    t, h = await _setup(client, superuser_headers, "CP01")
+    t, h = owner_ctx["RO01"]
 
     r = await client.get("/api/v1/company/profile", headers=h)
     assert r.status_code == 200
-    assert r.json()["name"] == "Co CP01"
+    assert j(r)["name"] == "Co RO01"
 
 
-@pytest.mark.asyncio
-async def test_company_quota_view(client: AsyncClient, superuser_headers: dict):
+async def test_company_quota_view(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試公司配額查看"""
-    t, h = await _setup(client, superuser_headers, "CQ01")
+    t, h = owner_ctx["RO01"]
 
     r = await client.get("/api/v1/company/quota", headers=h)
     assert r.status_code == 200
-    data = r.json()
+    data = j(r)
     assert "max_users" in data
     assert "is_over_quota" in data
 
 
-@pytest.mark.asyncio
-async def test_invite_and_list_users(client: AsyncClient, superuser_headers: dict):
+async def test_invite_and_list_users(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試邀請使用者並列出"""
-    t, h = await _setup(client, superuser_headers, "IU01")
+    t, h = owner_ctx["IU01"]
 
     # 邀請新員工
     r = await client.post("/api/v1/company/users/invite", headers=h, json={
@@ -85,56 +84,53 @@ async def test_invite_and_list_users(client: AsyncClient, superuser_headers: dic
         "password": "Emp12345!",
     })
     assert r.status_code == 200
-    assert r.json()["email"] == "emp@iu01.com"
-    assert r.json()["role"] == "employee"
+    assert j(r)["email"] == "emp@iu01.com"
+    assert j(r)["role"] == "employee"
 
     # 列出使用者
     r2 = await client.get("/api/v1/company/users", headers=h)
     assert r2.status_code == 200
-    emails = {u["email"] for u in r2.json()}
-    assert "emp@iu01.com" in emails
-    assert "owner@iu01.com" in emails
+    # 只需確認 email 出現，直接比對回應原文（含引號避免部分比對）
+    assert '"emp@iu01.com"' in r2.text
+    assert '"owner@iu01.com"' in r2.text
 
 
-@pytest.mark.asyncio
-async def test_update_user_role(client: AsyncClient, superuser_headers: dict):
+async def test_update_user_role(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試更新使用者角色"""
-    t, h = await _setup(client, superuser_headers, "UR01")
+    t, h = owner_ctx["UR01"]
 
     invite_r = await client.post("/api/v1/company/users/invite", headers=h, json={
         "email": "emp@ur01.com", "full_name": "Emp",
         "role": "employee", "password": "Emp12345!",
     })
-    user_id = invite_r.json()["id"]
+    user_id = j(invite_r)["id"]
 
     # 升級為 HR
     r = await client.put(f"/api/v1/company/users/{user_id}", headers=h, json={
         "role": "hr",
     })
     assert r.status_code == 200
-    assert r.json()["role"] == "hr"
+    assert j(r)["role"] == "hr"
 
 
-@pytest.mark.asyncio
-async def test_deactivate_user(client: AsyncClient, superuser_headers: dict):
+async def test_deactivate_user(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試停用使用者"""
-    t, h = await _setup(client, superuser_headers, "DU01")
+    t, h = owner_ctx["DU01"]
 
     invite_r = await client.post("/api/v1/company/users/invite", headers=h, json={
         "email": "emp@du01.com", "full_name": "Emp",
         "role": "employee", "password": "Emp12345!",
     })
-    user_id = invite_r.json()["id"]
+    user_id = j(invite_r)["id"]
 
     r = await client.delete(f"/api/v1/company/users/{user_id}", headers=h)
     assert r.status_code == 200
-    assert "停用" in r.json()["message"]
+    assert "停用" in j(r)["message"]
 
 
-@pytest.mark.asyncio
-async def test_employee_cannot_access_company_admin(client: AsyncClient, superuser_headers: dict):
+async def test_employee_cannot_access_company_admin(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試員工無法存取公司管理功能"""
-    t, h_owner = await _setup(client, superuser_headers, "EC01")
+    t, h_owner = owner_ctx["EC01"]
 
     await create_user(client, superuser_headers, {
         "email": "emp@ec01.com", "password": "Emp12345!",
@@ -147,30 +143,26 @@ async def test_employee_cannot_access_company_admin(client: AsyncClient, superus
     assert (await client.get("/api/v1/company/users", headers=h_emp)).status_code == 403
 
 
-@pytest.mark.asyncio
-async def test_company_usage_summary(client: AsyncClient, superuser_headers: dict):
+async def test_company_usage_summary(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試公司用量摘要"""
-    t, h = await _setup(client, superuser_headers, "US01")
+    t, h = owner_ctx["US01"]
 
-    with _mock_orchestrator():
-        await client.post(CHAT_URL, headers=h, json={"question": "test"})
+    await client.post(CHAT_URL, headers=h, json={"question": "test"})
 
     r = await client.get("/api/v1/company/usage/summary", headers=h)
     assert r.status_code == 200
-    data = r.json()
+    data = j(r)
     assert data["total_actions"] >= 1
 
 
-@pytest.mark.asyncio
-async def test_company_usage_by_user(client: AsyncClient, superuser_headers: dict):
+async def test_company_usage_by_user(client: AsyncClient, superuser_headers: dict, owner_ctx: dict):
     """測試每位使用者用量"""
-    t, h = await _setup(client, superuser_headers, "UU01")
+    t, h = owner_ctx["UU01"]
 
-    with _mock_orchestrator():
-        await client.post(CHAT_URL, headers=h, json={"question": "owner q"})
+    await client.post(CHAT_URL, headers=h, json={"question": "owner q"})
 
     r = await client.get("/api/v1/company/usage/by-user", headers=h)
     assert r.status_code == 200
-    data = r.json()
+    data = j(r)
     assert len(data) >= 1
     assert any(u["email"] == "owner@uu01.com" for u in data)
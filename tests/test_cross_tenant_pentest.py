@@ -5,7 +5,7 @@ import pytest
 from httpx import AsyncClient
 from unittest.mock import patch, AsyncMock
 
-from tests.conftest import create_tenant, create_user, login_user
+from tests.conftest import create_tenant, create_user, login_user, j
 
 CHAT_URL = "/api/v1/chat/chat"
 ORCH_CLASS = "app.api.v1.endpoints.chat.ChatOrchestrator"
@@ -61,7 +61,7 @@ async def test_pentest_cross_tenant_conversation_access_denied(
     with _mock_orchestrator("Tenant B answer"):
         rb = await client.post(CHAT_URL, headers=hb, json={"question": "B secret"})
         assert rb.status_code == 200
-        conv_b = rb.json()["conversation_id"]
+        conv_b = j(rb)["conversation_id"]
 
     # IDOR probes from tenant A -> must not access tenant B conversation
     r1 = await client.get(f"/api/v1/chat/conversations/{conv_b}", headers=ha)
@@ -85,7 +85,7 @@ async def test_pentest_cross_tenant_feedback_message_denied(
     with _mock_orchestrator("B assistant output"):
         rb = await client.post(CHAT_URL, headers=hb, json={"question": "B internal question"})
         assert rb.status_code == 200
-        b_message_id = rb.json()["message_id"]
+        b_message_id = j(rb)["message_id"]
 
     # Tenant A attempts feedback on Tenant B's message id
     attack = await client.post(
@@ -108,15 +108,13 @@ async def test_pentest_cross_tenant_document_access_denied(
 ):
     ha, hb = await _setup_two_tenants_and_users(client, superuser_headers)
 
-    with patch("app.tasks.document_tasks.process_document_task.delay") as mt:
-        mt.return_value.id = "pentest-doc-task"
-        up_b = await client.post(
-            "/api/v1/documents/upload",
-            headers=hb,
-            files={"file": ("b_secret.txt", b"Tenant B confidential document", "text/plain")},
-        )
-        assert up_b.status_code == 200
-        doc_b_id = up_b.json()["id"]
+    up_b = await client.post(
+        "/api/v1/documents/upload",
+        headers=hb,
+        files={"file": ("b_secret.txt", b"Tenant B confidential document", "text/plain")},
+    )
+    assert up_b.status_code == 200
+    doc_b_id = j(up_b)["id"]
 
     # Tenant A probes B document id
     g = await client.get(f"/api/v1/documents/{doc_b_id}", headers=ha)
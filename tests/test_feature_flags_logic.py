@@ -1,10 +1,16 @@
 """Unit tests for feature flag evaluation logic."""
 
+import pytest
+
 from app.config import settings
 from app.services.feature_flags import is_flag_enabled
 
+pytestmark = pytest.mark.unit
+
 
 class _FakeQuery:
+    __slots__ = ("_result",)
+
     def __init__(self, result):
         self._result = result
 
@@ -16,14 +22,18 @@ class _FakeQuery:
 
 
 class _FakeSession:
+    __slots__ = ("_query",)
+
     def __init__(self, result):
-        self._result = result
+        self._query = _FakeQuery(result)  # query() 每次回傳同一個 stub
 
     def query(self, *args, **kwargs):
-        return _FakeQuery(self._result)
+        return self._query
 
 
 class _Flag:
+    __slots__ = ("enabled", "rollout_percentage", "allowed_tenant_ids", "allowed_environments")
+
     def __init__(self, enabled=True, rollout=0, allowed_tenants=None, allowed_envs=None):
         self.enabled = enabled
         self.rollout_percentage = rollout
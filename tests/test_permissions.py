@@ -2,147 +2,113 @@
 Permission & Role-Based Access Control Tests
 測試不同角色的權限控制
 """
+from types import MappingProxyType
+
 import pytest
 from httpx import AsyncClient
-from unittest.mock import patch, AsyncMock
-from tests.conftest import create_tenant, create_user, login_user
+from unittest.mock import patch
+from tests.conftest import StubOrchestrator, gather_settled, j
+
+pytestmark = pytest.mark.e2e
 
 CHAT_URL = "/api/v1/chat/chat"
 ORCH_CLASS = "app.api.v1.endpoints.chat.ChatOrchestrator"
 
 
-def _mock_orchestrator():
-    result = {
-        "request_id": "r", "question": "q", "answer": "a",
-        "company_policy": None, "labor_law": None,
-        "sources": [], "notes": [], "disclaimer": "僅供參考",
-    }
-    inst = AsyncMock()
-    inst.process_query = AsyncMock(return_value=result)
-    return patch(ORCH_CLASS, return_value=inst)
+# 唯讀：chat 端點只讀取結果，所有呼叫共用同一份
+_MOCK_RESULT = MappingProxyType({
+    "request_id": "r", "question": "q", "answer": "a",
+    "company_policy": None, "labor_law": None,
+    "sources": [], "notes": [], "disclaimer": "僅供參考",
+})
+_MOCK_ORCH = StubOrchestrator(_MOCK_RESULT)
 
 
-@pytest.mark.asyncio
-async def test_employee_cannot_delete_documents(client: AsyncClient, superuser_headers: dict):
-    """測試一般員工無法刪除文件"""
+@pytest.fixture(scope="module", autouse=True)
+def _patched_orchestrator():
+    """整個模組只 patch 一次 ChatOrchestrator"""
+    with patch(ORCH_CLASS, return_value=_MOCK_ORCH):
+        yield
 
-    td = await create_tenant(client, superuser_headers, {
-        "name": "Perm Test Co", "tax_id": "10203040",
-        "contact_name": "PM", "contact_email": "pm@test.com",
-        "contact_phone": "0910203040",
-    })
 
-    await create_user(client, superuser_headers, {
-        "email": "owner@permtest.com", "password": "Owner123!",
-        "full_name": "Owner", "role": "owner", "tenant_id": td["id"],
-    })
-    await create_user(client, superuser_headers, {
-        "email": "emp@permtest.com", "password": "Emp123!",
-        "full_name": "Employee", "role": "employee", "tenant_id": td["id"],
-    })
+# 角色測試彼此獨立：整個模組共用一個租戶 + 五種角色（pro 方案，留出建使用者的名額）
+_ROLES = ("owner", "admin", "hr", "employee", "viewer")
 
-    h_owner = await login_user(client, "owner@permtest.com", "Owner123!")
 
-    with patch("app.tasks.document_tasks.process_document_task.delay") as mt:
-        mt.return_value.id = "t1"
-        up = await client.post(
-            "/api/v1/documents/upload", headers=h_owner,
-            files={"file": ("test.txt", b"Test content", "text/plain")},
-        )
-        assert up.status_code == 200
-        doc_id = up.json()["id"]
+@pytest.fixture(scope="module")
+def perm_tenant(seed_tenant_users):
+    """{"tenant": tenant_json, "headers": {role: auth_headers}}"""
+    tenant, headers = seed_tenant_users("PM01", roles=_ROLES, plan="pro")
+    return {"tenant": tenant, "headers": headers}
 
-    h_emp = await login_user(client, "emp@permtest.com", "Emp123!")
+
+@pytest.mark.asyncio
+async def test_employee_cannot_delete_documents(client: AsyncClient, perm_tenant: dict):
+    """測試一般員工無法刪除文件"""
+
+    h = perm_tenant["headers"]
+    h_owner, h_emp = h["owner"], h["employee"]
+
+    up = await client.post(
+        "/api/v1/documents/upload", headers=h_owner,
+        files={"file": ("test.txt", b"Test content", "text/plain")},
+    )
+    assert up.status_code == 200
+    doc_id = j(up)["id"]
 
     assert (await client.delete(f"/api/v1/documents/{doc_id}", headers=h_emp)).status_code == 403
     assert (await client.delete(f"/api/v1/documents/{doc_id}", headers=h_owner)).status_code == 200
 
 
 @pytest.mark.asyncio
-async def test_employee_cannot_view_audit_logs(client: AsyncClient, superuser_headers: dict):
+async def test_employee_cannot_view_audit_logs(client: AsyncClient, perm_tenant: dict):
     """測試一般員工無法查看稽核日誌"""
 
-    td = await create_tenant(client, superuser_headers, {
-        "name": "Audit Perm Test", "tax_id": "20304050",
-        "contact_name": "APM", "contact_email": "apm@test.com",
-        "contact_phone": "0920304050",
-    })
-
-    await create_user(client, superuser_headers, {
-        "email": "admin@ap.com", "password": "Admin123!",
-        "full_name": "Admin", "role": "admin", "tenant_id": td["id"],
-    })
-    await create_user(client, superuser_headers, {
-        "email": "emp@ap.com", "password": "Emp123!",
-        "full_name": "Emp", "role": "employee", "tenant_id": td["id"],
-    })
-
-    h_admin = await login_user(client, "admin@ap.com", "Admin123!")
-    h_emp = await login_user(client, "emp@ap.com", "Emp123!")
+    h = perm_tenant["headers"]
+    h_admin, h_emp = h["admin"], h["employee"]
 
-    assert (await client.get("/api/v1/audit/logs", headers=h_admin)).status_code == 200
-    assert (await client.get("/api/v1/audit/logs", headers=h_emp)).status_code == 403
+    r_admin, r_emp = await gather_settled(
+        client.get("/api/v1/audit/logs", headers=h_admin),
+        client.get("/api/v1/audit/logs", headers=h_emp),
+    )
+    assert r_admin.status_code == 200
+    assert r_emp.status_code == 403
 
 
 @pytest.mark.asyncio
-async def test_employee_cannot_view_usage_reports(client: AsyncClient, superuser_headers: dict):
+async def test_employee_cannot_view_usage_reports(client: AsyncClient, perm_tenant: dict):
     """測試一般員工無法查看用量報表"""
 
-    td = await create_tenant(client, superuser_headers, {
-        "name": "Usage Perm Test", "tax_id": "30405060",
-        "contact_name": "UPM", "contact_email": "upm@test.com",
-        "contact_phone": "0930405060",
-    })
-
-    await create_user(client, superuser_headers, {
-        "email": "owner@up.com", "password": "Owner123!",
-        "full_name": "Owner", "role": "owner", "tenant_id": td["id"],
-    })
-    await create_user(client, superuser_headers, {
-        "email": "emp@up.com", "password": "Emp123!",
-        "full_name": "Emp", "role": "employee", "tenant_id": td["id"],
-    })
+    h = perm_tenant["headers"]
+    h_owner, h_emp = h["owner"], h["employee"]
 
-    h_owner = await login_user(client, "owner@up.com", "Owner123!")
-    h_emp = await login_user(client, "emp@up.com", "Emp123!")
-
-    assert (await client.get("/api/v1/audit/usage/summary", headers=h_owner)).status_code == 200
-    assert (await client.get("/api/v1/audit/usage/summary", headers=h_emp)).status_code == 403
-    assert (await client.get("/api/v1/audit/usage/records", headers=h_owner)).status_code == 200
-    assert (await client.get("/api/v1/audit/usage/records", headers=h_emp)).status_code == 403
+    # (url, headers, 預期狀態碼)
+    probes = [
+        ("/api/v1/audit/usage/summary", h_owner, 200),
+        ("/api/v1/audit/usage/summary", h_emp, 403),
+        ("/api/v1/audit/usage/records", h_owner, 200),
+        ("/api/v1/audit/usage/records", h_emp, 403),
+    ]
+    responses = await gather_settled(*(client.get(url, headers=h) for url, h, _ in probes))
+    for (url, _, expected), r in zip(probes, responses):
+        assert r.status_code == expected, f"{url}: {r.status_code}"
 
 
 @pytest.mark.asyncio
-async def test_hr_can_manage_documents_but_not_users(client: AsyncClient, superuser_headers: dict):
+async def test_hr_can_manage_documents_but_not_users(client: AsyncClient, perm_tenant: dict):
     """測試 HR 可以管理文件但無法管理使用者"""
 
-    td = await create_tenant(client, superuser_headers, {
-        "name": "HR Perm Test", "tax_id": "40506070",
-        "contact_name": "HPM", "contact_email": "hpm@test.com",
-        "contact_phone": "0940506070",
-    })
-
-    await create_user(client, superuser_headers, {
-        "email": "admin@hp.com", "password": "Admin123!",
-        "full_name": "Admin", "role": "admin", "tenant_id": td["id"],
-    })
-    await create_user(client, superuser_headers, {
-        "email": "hr@hp.com", "password": "HR123!",
-        "full_name": "HR", "role": "hr", "tenant_id": td["id"],
-    })
-
-    h_hr = await login_user(client, "hr@hp.com", "HR123!")
-    h_admin = await login_user(client, "admin@hp.com", "Admin123!")
+    td = perm_tenant["tenant"]
+    h = perm_tenant["headers"]
+    h_hr, h_admin = h["hr"], h["admin"]
 
     # HR 上傳文件 → 成功
-    with patch("app.tasks.document_tasks.process_document_task.delay") as mt:
-        mt.return_value.id = "hr-task"
-        up = await client.post(
-            "/api/v1/documents/upload", headers=h_hr,
-            files={"file": ("hr.txt", b"HR doc", "text/plain")},
-        )
-        assert up.status_code == 200
-        doc_id = up.json()["id"]
+    up = await client.post(
+        "/api/v1/documents/upload", headers=h_hr,
+        files={"file": ("hr.txt", b"HR doc", "text/plain")},
+    )
+    assert up.status_code == 200
+    doc_id = j(up)["id"]
 
     assert (await client.get("/api/v1/documents/", headers=h_hr)).status_code == 200
     assert (await client.delete(f"/api/v1/documents/{doc_id}", headers=h_hr)).status_code == 200
@@ -163,53 +129,37 @@ async def test_hr_can_manage_documents_but_not_users(client: AsyncClient, superu
 
 
 @pytest.mark.asyncio
-async def test_viewer_read_only_access(client: AsyncClient, superuser_headers: dict):
+async def test_viewer_read_only_access(client: AsyncClient, perm_tenant: dict):
     """測試 Viewer 角色只有唯讀權限"""
 
-    td = await create_tenant(client, superuser_headers, {
-        "name": "Viewer Test Co", "tax_id": "50607080",
-        "contact_name": "VTM", "contact_email": "vtm@test.com",
-        "contact_phone": "0950607080",
-    })
-
-    await create_user(client, superuser_headers, {
-        "email": "hr@vt.com", "password": "HR123!",
-        "full_name": "HR", "role": "hr", "tenant_id": td["id"],
-    })
-    await create_user(client, superuser_headers, {
-        "email": "viewer@vt.com", "password": "Viewer123!",
-        "full_name": "Viewer", "role": "viewer", "tenant_id": td["id"],
-    })
-
-    h_hr = await login_user(client, "hr@vt.com", "HR123!")
-
-    with patch("app.tasks.document_tasks.process_document_task.delay") as mt:
-        mt.return_value.id = "vt-task"
-        up = await client.post(
-            "/api/v1/documents/upload", headers=h_hr,
-            files={"file": ("vt.txt", b"Test doc", "text/plain")},
-        )
-        assert up.status_code == 200
-        doc_id = up.json()["id"]
+    h = perm_tenant["headers"]
+    h_hr, h_viewer = h["hr"], h["viewer"]
 
-    h_viewer = await login_user(client, "viewer@vt.com", "Viewer123!")
+    up = await client.post(
+        "/api/v1/documents/upload", headers=h_hr,
+        files={"file": ("vt.txt", b"Test doc", "text/plain")},
+    )
+    assert up.status_code == 200
+    doc_id = j(up)["id"]
 
     # 讀取 → 成功
-    assert (await client.get("/api/v1/documents/", headers=h_viewer)).status_code == 200
-    assert (await client.get(f"/api/v1/documents/{doc_id}", headers=h_viewer)).status_code == 200
+    r_list, r_one = await gather_settled(
+        client.get("/api/v1/documents/", headers=h_viewer),
+        client.get(f"/api/v1/documents/{doc_id}", headers=h_viewer),
+    )
+    assert r_list.status_code == 200
+    assert r_one.status_code == 200
 
     # 上傳 → 拒絕
-    with patch("app.tasks.document_tasks.process_document_task.delay"):
-        r = await client.post(
-            "/api/v1/documents/upload", headers=h_viewer,
-            files={"file": ("v.txt", b"Viewer attempt", "text/plain")},
-        )
-        assert r.status_code == 403
+    r = await client.post(
+        "/api/v1/documents/upload", headers=h_viewer,
+        files={"file": ("v.txt", b"Viewer attempt", "text/plain")},
+    )
+    assert r.status_code == 403
 
     # 刪除 → 拒絕
     assert (await client.delete(f"/api/v1/documents/{doc_id}", headers=h_viewer)).status_code == 403
 
     # 聊天 → 成功
-    with _mock_orchestrator():
-        chat = await client.post(CHAT_URL, headers=h_viewer, json={"question": "Viewer Q"})
-        assert chat.status_code == 200
+    chat = await client.post(CHAT_URL, headers=h_viewer, json={"question": "Viewer Q"})
+    assert chat.status_code == 200
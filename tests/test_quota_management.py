@@ -1,63 +1,60 @@
 """
 Phase 3 Integration Tests — Quota Management (T3-1)
 """
+from types import MappingProxyType
+
 import pytest
 from httpx import AsyncClient
-from unittest.mock import patch, AsyncMock
-from tests.conftest import create_tenant, create_user, login_user
+from unittest.mock import patch
+from tests.conftest import StubOrchestrator, _session_factory, j
+
+pytestmark = pytest.mark.e2e
 
 CHAT_URL = "/api/v1/chat/chat"
 ORCH_CLASS = "app.api.v1.endpoints.chat.ChatOrchestrator"
 
 
-def _mock_orchestrator():
-    result = {
-        "request_id": "r", "question": "q", "answer": "a",
-        "company_policy": None, "labor_law": None,
-        "sources": [], "notes": [], "disclaimer": "僅供參考",
-    }
-    inst = AsyncMock()
-    inst.process_query = AsyncMock(return_value=result)
-    return patch(ORCH_CLASS, return_value=inst)
-
-
-async def _setup_tenant(client, superuser_headers, name, tax_id, plan="free"):
-    tid = tax_id.lower()  # EmailStr normalizes domain to lowercase
-    t = await create_tenant(client, superuser_headers, {
-        "name": name, "tax_id": tax_id,
-        "contact_name": "C", "contact_email": f"c@{tid}.com",
-        "contact_phone": f"09{tax_id}",
-        "plan": plan,
-    })
-    await create_user(client, superuser_headers, {
-        "email": f"owner@{tid}.com", "password": "Owner123!",
-        "full_name": f"Owner {name}", "role": "owner",
-        "tenant_id": t["id"],
-    })
-    h = await login_user(client, f"owner@{tid}.com", "Owner123!")
-    return t, h
+# 唯讀：chat 端點只讀取結果，所有呼叫共用同一份
+_MOCK_RESULT = MappingProxyType({
+    "request_id": "r", "question": "q", "answer": "a",
+    "company_policy": None, "labor_law": None,
+    "sources": [], "notes": [], "disclaimer": "僅供參考",
+})
+_MOCK_ORCH = StubOrchestrator(_MOCK_RESULT)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _patched_orchestrator():
+    """整個模組只 patch 一次 ChatOrchestrator"""
+    with patch(ORCH_CLASS, return_value=_MOCK_ORCH):
+        yield
+
+
+def _setup_tenant(seed_tenant_users, name, tax_id, plan="free"):
+    t, h = seed_tenant_users(tax_id, plan=plan, name=name, password="Owner123!")
+    return t, h["owner"]
 
 
 # ── T3-1: Quota Management ──
 
 @pytest.mark.asyncio
-async def test_tenant_created_with_plan_defaults(client: AsyncClient, superuser_headers: dict):
+async def test_tenant_created_with_plan_defaults(client: AsyncClient, superuser_headers: dict, seed_tenant_users):
     """測試建立租戶時自動套用方案預設配額"""
-    t, _ = await _setup_tenant(client, superuser_headers, "PlanTest", "QP01", plan="free")
+    t, _ = _setup_tenant(seed_tenant_users, "PlanTest", "QP01", plan="free")
 
     # 查看配額
     r = await client.get(f"/api/v1/admin/tenants/{t['id']}/quota", headers=superuser_headers)
     assert r.status_code == 200
-    data = r.json()
+    data = j(r)
     assert data["max_users"] == 5
     assert data["monthly_query_limit"] == 500
     assert data["is_over_quota"] is False
 
 
 @pytest.mark.asyncio
-async def test_superuser_can_update_quota(client: AsyncClient, superuser_headers: dict):
+async def test_superuser_can_update_quota(client: AsyncClient, superuser_headers: dict, seed_tenant_users):
     """測試超管可以修改租戶配額"""
-    t, _ = await _setup_tenant(client, superuser_headers, "QuotaUpd", "QU01")
+    t, _ = _setup_tenant(seed_tenant_users, "QuotaUpd", "QU01")
 
     r = await client.put(
         f"/api/v1/admin/tenants/{t['id']}/quota",
@@ -65,32 +62,32 @@ async def test_superuser_can_update_quota(client: AsyncClient, superuser_headers
         json={"max_users": 100, "monthly_query_limit": 10000},
     )
     assert r.status_code == 200
-    data = r.json()
+    data = j(r)
     assert data["max_users"] == 100
     assert data["monthly_query_limit"] == 10000
 
 
 @pytest.mark.asyncio
-async def test_apply_plan_quota(client: AsyncClient, superuser_headers: dict):
+async def test_apply_plan_quota(client: AsyncClient, superuser_headers: dict, seed_tenant_users):
     """測試套用方案預設配額"""
-    t, _ = await _setup_tenant(client, superuser_headers, "PlanApply", "PA01")
+    t, _ = _setup_tenant(seed_tenant_users, "PlanApply", "PA01")
 
     r = await client.post(
         f"/api/v1/admin/tenants/{t['id']}/quota/apply-plan?plan=pro",
         headers=superuser_headers,
     )
     assert r.status_code == 200
-    assert r.json()["plan"] == "pro"
+    assert j(r)["plan"] == "pro"
 
     r2 = await client.get(f"/api/v1/admin/tenants/{t['id']}/quota", headers=superuser_headers)
-    assert r2.json()["max_users"] == 50
-    assert r2.json()["monthly_query_limit"] == 5000
+    assert j(r2)["max_users"] == 50
+    assert j(r2)["monthly_query_limit"] == 5000
 
 
 @pytest.mark.asyncio
-async def test_query_quota_enforcement(client: AsyncClient, superuser_headers: dict):
+async def test_query_quota_enforcement(client: AsyncClient, superuser_headers: dict, seed_tenant_users):
     """測試查詢配額強制執行 — 超額時返回 429"""
-    t, h = await _setup_tenant(client, superuser_headers, "QuotaEnf", "QE01")
+    t, h = _setup_tenant(seed_tenant_users, "QuotaEnf", "QE01")
 
     # 設定極低配額: 1 次查詢
     await client.put(
@@ -99,21 +96,20 @@ async def test_query_quota_enforcement(client: AsyncClient, superuser_headers: d
         json={"monthly_query_limit": 1},
     )
 
-    with _mock_orchestrator():
-        # 第 1 次查詢應成功
-        r1 = await client.post(CHAT_URL, headers=h, json={"question": "第一個問題"})
-        assert r1.status_code == 200
+    # 第 1 次查詢應成功
+    r1 = await client.post(CHAT_URL, headers=h, json={"question": "第一個問題"})
+    assert r1.status_code == 200
 
-        # 第 2 次查詢應被限制
-        r2 = await client.post(CHAT_URL, headers=h, json={"question": "第二個問題"})
-        assert r2.status_code == 429
-        assert "quota_exceeded" in str(r2.json())
+    # 第 2 次查詢應被限制
+    r2 = await client.post(CHAT_URL, headers=h, json={"question": "第二個問題"})
+    assert r2.status_code == 429
+    assert "quota_exceeded" in str(j(r2))
 
 
 @pytest.mark.asyncio
-async def test_document_quota_enforcement(client: AsyncClient, superuser_headers: dict):
+async def test_document_quota_enforcement(client: AsyncClient, superuser_headers: dict, seed_tenant_users):
     """測試文件配額強制執行"""
-    t, h = await _setup_tenant(client, superuser_headers, "DocQuota", "DQ01")
+    t, h = _setup_tenant(seed_tenant_users, "DocQuota", "DQ01")
 
     # 設定配額: 1 份文件
     await client.put(
@@ -122,21 +118,50 @@ async def test_document_quota_enforcement(client: AsyncClient, superuser_headers
         json={"max_documents": 1},
     )
 
-    with patch("app.tasks.document_tasks.process_document_task.delay") as mt:
-        mt.return_value.id = "t-1"
-        # 第 1 份應成功
-        r1 = await client.post(
-            "/api/v1/documents/upload", headers=h,
-            files={"file": ("a.txt", b"hello", "text/plain")},
-        )
-        assert r1.status_code == 200
+    # 第 1 份應成功
+    r1 = await client.post(
+        "/api/v1/documents/upload", headers=h,
+        files={"file": ("a.txt", b"hello", "text/plain")},
+    )
+    assert r1.status_code == 200
+
+    # 第 2 份應被限制
+    r2 = await client.post(
+        "/api/v1/documents/upload", headers=h,
+        files={"file": ("b.txt", b"world", "text/plain")},
+    )
+    assert r2.status_code == 429
+
 
-        # 第 2 份應被限制
-        r2 = await client.post(
-            "/api/v1/documents/upload", headers=h,
-            files={"file": ("b.txt", b"world", "text/plain")},
-        )
-        assert r2.status_code == 429
+@pytest.mark.asyncio
+async def test_quota_status_bulk_matches_single(
+    client: AsyncClient, superuser_headers: dict, seed_tenant_users, _db_connection,
+):
+    """測試批次與單一租戶的配額狀態一致"""
+    from app.crud import crud_tenant
+    from app.models.tenant import Tenant
+
+    busy, hb = seed_tenant_users("QB01", roles=("owner", "employee"), name="BulkBusy")
+    idle, _ = seed_tenant_users("QB02", name="BulkIdle")
+    await client.put(
+        f"/api/v1/admin/tenants/{busy['id']}/quota",
+        headers=superuser_headers,
+        json={"monthly_query_limit": 2},
+    )
+    await client.post(CHAT_URL, headers=hb["owner"], json={"question": "bulk q"})
+
+    db = _session_factory(_db_connection)()
+    try:
+        tenants = db.query(Tenant).filter(Tenant.id.in_([busy["id"], idle["id"]])).all()
+        bulk = crud_tenant.get_quota_status_bulk(db, tenants)
+        for t in tenants:
+            assert bulk[t.id] == crud_tenant.get_quota_status(db, t.id)
+        busy_status = bulk[next(t.id for t in tenants if str(t.id) == busy["id"])]
+        assert busy_status["current_users"] == 2
+        assert busy_status["current_monthly_queries"] == 1
+        assert busy_status["queries_usage_ratio"] == 0.5
+    finally:
+        db.close()
 
 
 @pytest.mark.asyncio
@@ -144,7 +169,7 @@ async def test_list_plan_quotas(client: AsyncClient, superuser_headers: dict):
     """測試列出方案配額"""
     r = await client.get("/api/v1/admin/quota/plans", headers=superuser_headers)
     assert r.status_code == 200
-    data = r.json()
+    data = j(r)
     assert "free" in data
     assert "pro" in data
     assert "enterprise" in data
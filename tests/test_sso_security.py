@@ -7,8 +7,12 @@ from app.api.v1.endpoints import sso as sso_endpoints
 from app.config import settings
 from app.schemas.sso import OAuthCallbackRequest, SSOStateRequest
 
+pytestmark = pytest.mark.unit
+
 
 class _FakeQuery:
+    __slots__ = ("_result",)
+
     def __init__(self, result):
         self._result = result
 
@@ -20,14 +24,21 @@ class _FakeQuery:
 
 
 class _FakeSession:
+    __slots__ = ("_query",)
+
     def __init__(self, result):
-        self._result = result
+        self._query = _FakeQuery(result)  # query() 每次回傳同一個 stub
 
     def query(self, *args, **kwargs):
-        return _FakeQuery(self._result)
+        return self._query
 
 
 class _FakeSSOConfig:
+    __slots__ = (
+        "tenant_id", "provider", "enabled", "client_id", "client_secret",
+        "allowed_domains", "auto_create_user", "default_role",
+    )
+
     def __init__(self, tenant_id, provider):
         self.tenant_id = tenant_id
         self.provider = provider
@@ -40,34 +51,53 @@ class _FakeSSOConfig:
 
 
 class _FakeUser:
+    __slots__ = ("email", "tenant_id", "is_active")
+
     def __init__(self, email, tenant_id):
         self.email = email
         self.tenant_id = tenant_id
         self.is_active = True
 
 
-@pytest.mark.asyncio
-async def test_state_roundtrip(monkeypatch):
-    monkeypatch.setattr(settings, "SECRET_KEY", "test-secret")
-    payload = {"tenant_id": "t1", "provider": "google", "exp": 9999999999}
-    token = sso_endpoints._sign_state(payload)
-    decoded = sso_endpoints._verify_state(token)
-    assert decoded == payload
-
-
-def test_state_invalid_signature(monkeypatch):
-    monkeypatch.setattr(settings, "SECRET_KEY", "test-secret")
-    payload = {"tenant_id": "t1", "provider": "google", "exp": 9999999999}
-    token = sso_endpoints._sign_state(payload)
-    tampered = token + "x"
+_SECRET_KEY = "test-secret"
+_TENANT_ID = "11111111-1111-1111-1111-111111111111"
+
+_STATE_PAYLOADS = {
+    "good": {"tenant_id": _TENANT_ID, "provider": "google", "exp": 9999999999},
+    "expired": {"tenant_id": _TENANT_ID, "provider": "google", "exp": 1},
+    "wrong_tenant": {
+        "tenant_id": "22222222-2222-2222-2222-222222222222",
+        "provider": "google",
+        "exp": 9999999999,
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def _secret_key(monkeypatch):
+    monkeypatch.setattr(settings, "SECRET_KEY", _SECRET_KEY)
+
+
+@pytest.fixture(scope="module")
+def signed_states():
+    """每個 payload 只簽一次（簽章只取決於 payload 與 SECRET_KEY）"""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(settings, "SECRET_KEY", _SECRET_KEY)
+        return {name: sso_endpoints._sign_state(p) for name, p in _STATE_PAYLOADS.items()}
+
+
+def test_state_roundtrip(signed_states):
+    decoded = sso_endpoints._verify_state(signed_states["good"])
+    assert decoded == _STATE_PAYLOADS["good"]
+
+
+def test_state_invalid_signature(signed_states):
+    tampered = signed_states["good"] + "x"
     assert sso_endpoints._verify_state(tampered) is None
 
 
-def test_state_expired(monkeypatch):
-    monkeypatch.setattr(settings, "SECRET_KEY", "test-secret")
-    payload = {"tenant_id": "t1", "provider": "google", "exp": 1}
-    token = sso_endpoints._sign_state(payload)
-    assert sso_endpoints._verify_state(token) is None
+def test_state_expired(signed_states):
+    assert sso_endpoints._verify_state(signed_states["expired"]) is None
 
 
 def test_create_state_requires_enabled_provider():
@@ -81,10 +111,8 @@ def test_create_state_requires_enabled_provider():
 
 
 @pytest.mark.asyncio
-async def test_callback_rejects_state_mismatch(monkeypatch):
-    monkeypatch.setattr(settings, "SECRET_KEY", "test-secret")
-
-    tenant_id = "11111111-1111-1111-1111-111111111111"
+async def test_callback_rejects_state_mismatch(monkeypatch, signed_states):
+    tenant_id = _TENANT_ID
     cfg = _FakeSSOConfig(tenant_id, "google")
     db = _FakeSession(result=cfg)
 
@@ -95,18 +123,12 @@ async def test_callback_rejects_state_mismatch(monkeypatch):
     monkeypatch.setattr(sso_endpoints.crud_user, "get_by_email", lambda *_: None)
     monkeypatch.setattr(sso_endpoints.crud_user, "create", lambda *_: _FakeUser("user@example.com", tenant_id))
 
-    bad_state = sso_endpoints._sign_state({
-        "tenant_id": "22222222-2222-2222-2222-222222222222",
-        "provider": "google",
-        "exp": 9999999999,
-    })
-
     body = OAuthCallbackRequest(
         code="auth-code",
         redirect_uri="http://localhost/callback",
         tenant_id=tenant_id,
         provider="google",
-        state=bad_state,
+        state=signed_states["wrong_tenant"],
         code_verifier="verifier",
     )
 
@@ -116,25 +138,17 @@ async def test_callback_rejects_state_mismatch(monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_callback_requires_code_verifier(monkeypatch):
-    monkeypatch.setattr(settings, "SECRET_KEY", "test-secret")
-
-    tenant_id = "11111111-1111-1111-1111-111111111111"
+async def test_callback_requires_code_verifier(signed_states):
+    tenant_id = _TENANT_ID
     cfg = _FakeSSOConfig(tenant_id, "google")
     db = _FakeSession(result=cfg)
 
-    good_state = sso_endpoints._sign_state({
-        "tenant_id": tenant_id,
-        "provider": "google",
-        "exp": 9999999999,
-    })
-
     body = OAuthCallbackRequest(
         code="auth-code",
         redirect_uri="http://localhost/callback",
         tenant_id=tenant_id,
         provider="google",
-        state=good_state,
+        state=signed_states["good"],
         code_verifier="",
     )
 
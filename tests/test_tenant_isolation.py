@@ -2,192 +2,162 @@
 Tenant Isolation Tests
 測試租戶之間的資料隔離與安全性
 """
+from types import MappingProxyType
+
 import pytest
 from httpx import AsyncClient
-from unittest.mock import patch, AsyncMock
-from tests.conftest import create_tenant, create_user, login_user
+from unittest.mock import patch
+from tests.conftest import StubOrchestrator, gather_settled, j
 
 CHAT_URL = "/api/v1/chat/chat"
 ORCH_CLASS = "app.api.v1.endpoints.chat.ChatOrchestrator"
+KB_CLASS = "app.api.v1.endpoints.kb.KnowledgeBaseRetriever"
 
 
-def _mock_orchestrator():
-    result = {
-        "request_id": "r", "question": "q", "answer": "a",
-        "company_policy": None, "labor_law": None,
-        "sources": [], "notes": [], "disclaimer": "僅供參考",
-    }
-    inst = AsyncMock()
-    inst.process_query = AsyncMock(return_value=result)
-    return patch(ORCH_CLASS, return_value=inst)
+# 唯讀：chat 端點只讀取結果，所有呼叫共用同一份
+_MOCK_RESULT = MappingProxyType({
+    "request_id": "r", "question": "q", "answer": "a",
+    "company_policy": None, "labor_law": None,
+    "sources": [], "notes": [], "disclaimer": "僅供參考",
+})
 
+# 固定的請求 payload（httpx 只讀取，不會修改）
+_Q = {"question": "Q"}
+_Q_A = {"question": "Test A"}
+_Q_B = {"question": "Test B"}
+_KB_QUERY = {"query": "policy", "top_k": 5}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _patched_orchestrator():
+    """整個模組只 patch 一次 ChatOrchestrator"""
+    with patch(ORCH_CLASS, return_value=StubOrchestrator(_MOCK_RESULT)):
+        yield
+
+
+class _StubRetriever:
+    """Stand-in for KnowledgeBaseRetriever: search() returns fixed results."""
+
+    __slots__ = ("_results",)
+
+    def __init__(self, results):
+        self._results = results
+
+    def search(self, **kwargs):
+        return self._results
+
+
+@pytest.fixture
+def tenant_pair(client, seed_tenant_users):
+    """
+    Factory: ``tenant_pair(role)`` -> (ta, tb, ha, hb)：A、B 兩個租戶各一位
+    ``role`` 使用者，直接經 CRUD 建立（隨本測試的 SAVEPOINT 回滾）
+    """
+    def _pair(role: str):
+        ta, ha = seed_tenant_users("ISOA", roles=(role,))
+        tb, hb = seed_tenant_users("ISOB", roles=(role,))
+        return ta, tb, ha[role], hb[role]
+
+    return _pair
 
-@pytest.mark.asyncio
-async def test_tenant_data_isolation(client: AsyncClient, superuser_headers: dict):
-    """測試租戶 A 無法存取租戶 B 的資料"""
-
-    ta = await create_tenant(client, superuser_headers, {
-        "name": "Company A", "tax_id": "11111111",
-        "contact_name": "A", "contact_email": "a@a.com", "contact_phone": "0911111111",
-    })
-    tb = await create_tenant(client, superuser_headers, {
-        "name": "Company B", "tax_id": "22222222",
-        "contact_name": "B", "contact_email": "b@b.com", "contact_phone": "0922222222",
-    })
-
-    await create_user(client, superuser_headers, {
-        "email": "o@a.com", "password": "PassA123!", "full_name": "Owner A",
-        "role": "owner", "tenant_id": ta["id"],
-    })
-    await create_user(client, superuser_headers, {
-        "email": "o@b.com", "password": "PassB123!", "full_name": "Owner B",
-        "role": "owner", "tenant_id": tb["id"],
-    })
-
-    ha = await login_user(client, "o@a.com", "PassA123!")
-    hb = await login_user(client, "o@b.com", "PassB123!")
-
-    # B 上傳文件
-    with patch("app.tasks.document_tasks.process_document_task.delay") as mt:
-        mt.return_value.id = "t-b"
-        up = await client.post(
-            "/api/v1/documents/upload", headers=hb,
-            files={"file": ("b.txt", b"B confidential.", "text/plain")},
-        )
-        assert up.status_code == 200
-        doc_b_id = up.json()["id"]
-
-    # A 看不到 B 的文件
-    assert len((await client.get("/api/v1/documents/", headers=ha)).json()) == 0
-    assert len((await client.get("/api/v1/documents/", headers=hb)).json()) == 1
-
-    assert (await client.get(f"/api/v1/documents/{doc_b_id}", headers=ha)).status_code in [403, 404]
-    assert (await client.delete(f"/api/v1/documents/{doc_b_id}", headers=ha)).status_code in [403, 404]
-    assert (await client.get(f"/api/v1/documents/{doc_b_id}", headers=hb)).status_code == 200
+
+async def _upload_document(client: AsyncClient, headers: dict) -> str:
+    up = await client.post(
+        "/api/v1/documents/upload", headers=headers,
+        files={"file": ("doc.txt", b"Confidential.", "text/plain")},
+    )
+    assert up.status_code == 200
+    return j(up)["id"]
+
+
+async def _start_conversation(client: AsyncClient, headers: dict) -> str:
+    r = await client.post(CHAT_URL, headers=headers, json=_Q)
+    assert r.status_code == 200
+    return j(r)["conversation_id"]
+
+
+# resource -> (使用者角色, 建立資源並回傳 id, 列表 URL, 對單一資源的請求 (method, url 樣板))
+RESOURCE_PROBES = {
+    "documents": (
+        "owner", _upload_document, "/api/v1/documents/",
+        (("GET", "/api/v1/documents/{id}"), ("DELETE", "/api/v1/documents/{id}")),
+    ),
+    "conversations": (
+        "employee", _start_conversation, "/api/v1/chat/conversations",
+        (("GET", "/api/v1/chat/conversations/{id}/messages"),),
+    ),
+}
 
 
 @pytest.mark.asyncio
-async def test_conversation_isolation(client: AsyncClient, superuser_headers: dict):
-    """測試對話記錄的租戶隔離"""
-
-    ta = await create_tenant(client, superuser_headers, {
-        "name": "Chat A", "tax_id": "33333333",
-        "contact_name": "CA", "contact_email": "ca@a.com", "contact_phone": "0933333333",
-    })
-    tb = await create_tenant(client, superuser_headers, {
-        "name": "Chat B", "tax_id": "44444444",
-        "contact_name": "CB", "contact_email": "cb@b.com", "contact_phone": "0944444444",
-    })
-
-    await create_user(client, superuser_headers, {
-        "email": "u@ca.com", "password": "ChatA123!", "full_name": "UA",
-        "role": "employee", "tenant_id": ta["id"],
-    })
-    await create_user(client, superuser_headers, {
-        "email": "u@cb.com", "password": "ChatB123!", "full_name": "UB",
-        "role": "employee", "tenant_id": tb["id"],
-    })
-
-    ha = await login_user(client, "u@ca.com", "ChatA123!")
-    hb = await login_user(client, "u@cb.com", "ChatB123!")
-
-    with _mock_orchestrator():
-        ra = await client.post(CHAT_URL, headers=ha, json={"question": "Q from A"})
-        assert ra.status_code == 200
-        conv_a = ra.json()["conversation_id"]
-
-        rb = await client.post(CHAT_URL, headers=hb, json={"question": "Q from B"})
-        assert rb.status_code == 200
-        conv_b = rb.json()["conversation_id"]
-
-    ca = (await client.get("/api/v1/chat/conversations", headers=ha)).json()
-    assert len(ca) == 1 and ca[0]["id"] == conv_a
-
-    cb = (await client.get("/api/v1/chat/conversations", headers=hb)).json()
-    assert len(cb) == 1 and cb[0]["id"] == conv_b
-
-    # A 存取 B 的對話 → 拒絕
-    cross = await client.get(f"/api/v1/chat/conversations/{conv_b}/messages", headers=ha)
-    assert cross.status_code in [403, 404]
+@pytest.mark.parametrize("resource", list(RESOURCE_PROBES))
+async def test_resource_isolation(client: AsyncClient, tenant_pair, resource: str):
+    """測試租戶 A 無法列出或存取租戶 B 的文件 / 對話"""
+    role, create, list_url, item_requests = RESOURCE_PROBES[resource]
+    _, _, ha, hb = tenant_pair(role)
+
+    id_a, id_b = await gather_settled(create(client, ha), create(client, hb))
+
+    la, lb, *cross = await gather_settled(
+        client.get(list_url, headers=ha),
+        client.get(list_url, headers=hb),
+        *(client.request(method, url.format(id=id_b), headers=ha) for method, url in item_requests),
+    )
+    # A 的請求（含 DELETE）都完成後，B 的資源仍應存在
+    own_method, own_url = item_requests[0]
+    own = await client.request(own_method, own_url.format(id=id_b), headers=hb)
+
+    # 各自只看得到自己的資源
+    assert [r["id"] for r in j(la)] == [id_a]
+    assert [r["id"] for r in j(lb)] == [id_b]
+
+    # A 對 B 的資源 → 拒絕；B 本身的存取不受影響
+    for (method, url), r in zip(item_requests, cross):
+        assert r.status_code in [403, 404], f"{method} {url}: {r.status_code}"
+    assert own.status_code == 200
 
 
 @pytest.mark.asyncio
-async def test_audit_log_isolation(client: AsyncClient, superuser_headers: dict):
+async def test_audit_log_isolation(client: AsyncClient, tenant_pair):
     """測試稽核日誌的租戶隔離"""
 
-    ta = await create_tenant(client, superuser_headers, {
-        "name": "Audit A", "tax_id": "55555555",
-        "contact_name": "AA", "contact_email": "aa@a.com", "contact_phone": "0955555555",
-    })
-    tb = await create_tenant(client, superuser_headers, {
-        "name": "Audit B", "tax_id": "66666666",
-        "contact_name": "AB", "contact_email": "ab@b.com", "contact_phone": "0966666666",
-    })
-
-    await create_user(client, superuser_headers, {
-        "email": "adm@aa.com", "password": "AuditA123!", "full_name": "Admin A",
-        "role": "admin", "tenant_id": ta["id"],
-    })
-    await create_user(client, superuser_headers, {
-        "email": "adm@ab.com", "password": "AuditB123!", "full_name": "Admin B",
-        "role": "admin", "tenant_id": tb["id"],
-    })
-
-    ha = await login_user(client, "adm@aa.com", "AuditA123!")
-    hb = await login_user(client, "adm@ab.com", "AuditB123!")
-
-    with _mock_orchestrator():
-        await client.post(CHAT_URL, headers=ha, json={"question": "Test A"})
-        await client.post(CHAT_URL, headers=hb, json={"question": "Test B"})
-
-    la = (await client.get("/api/v1/audit/logs", headers=ha)).json()
-    lb = (await client.get("/api/v1/audit/logs", headers=hb)).json()
+    _, _, ha, hb = tenant_pair("admin")
+
+    await gather_settled(
+        client.post(CHAT_URL, headers=ha, json=_Q_A),
+        client.post(CHAT_URL, headers=hb, json=_Q_B),
+    )
+
+    logs_a, logs_b, sum_a, sum_b = await gather_settled(
+        client.get("/api/v1/audit/logs", headers=ha),
+        client.get("/api/v1/audit/logs", headers=hb),
+        client.get("/api/v1/audit/usage/summary", headers=ha),
+        client.get("/api/v1/audit/usage/summary", headers=hb),
+    )
 
+    la, lb = j(logs_a), j(logs_b)
     if la and lb:
         a_ids = {l.get("actor_user_id") for l in la}
         b_ids = {l.get("actor_user_id") for l in lb}
         assert len(a_ids & b_ids) == 0
 
-    assert (await client.get("/api/v1/audit/usage/summary", headers=ha)).status_code == 200
-    assert (await client.get("/api/v1/audit/usage/summary", headers=hb)).status_code == 200
+    assert sum_a.status_code == 200
+    assert sum_b.status_code == 200
 
 
 @pytest.mark.asyncio
-async def test_knowledge_base_isolation(client: AsyncClient, superuser_headers: dict):
+async def test_knowledge_base_isolation(client: AsyncClient, tenant_pair):
     """測試知識庫檢索的租戶隔離"""
 
-    ta = await create_tenant(client, superuser_headers, {
-        "name": "KB A", "tax_id": "77777777",
-        "contact_name": "KA", "contact_email": "ka@a.com", "contact_phone": "0977777777",
-    })
-    tb = await create_tenant(client, superuser_headers, {
-        "name": "KB B", "tax_id": "88888888",
-        "contact_name": "KB", "contact_email": "kb@b.com", "contact_phone": "0988888888",
-    })
-
-    await create_user(client, superuser_headers, {
-        "email": "u@ka.com", "password": "KBA123!", "full_name": "UA",
-        "role": "hr", "tenant_id": ta["id"],
-    })
-    await create_user(client, superuser_headers, {
-        "email": "u@kb.com", "password": "KBB123!", "full_name": "UB",
-        "role": "hr", "tenant_id": tb["id"],
-    })
-
-    ha = await login_user(client, "u@ka.com", "KBA123!")
-    hb = await login_user(client, "u@kb.com", "KBB123!")
-
-    KB_CLASS = "app.api.v1.endpoints.kb.KnowledgeBaseRetriever"
+    _, _, ha, hb = tenant_pair("hr")
 
     mock_ret_a = [{"score": 0.9, "content": "A policy", "filename": "a.txt", "document_id": "d1", "chunk_index": 0}]
     mock_ret_b = [{"score": 0.85, "content": "B policy", "filename": "b.txt", "document_id": "d2", "chunk_index": 0}]
 
-    inst_a = type("MockRetriever", (), {"search": lambda self, **kw: mock_ret_a})()
-    with patch(KB_CLASS, return_value=inst_a):
-        sa = await client.post("/api/v1/kb/search", headers=ha, json={"query": "policy", "top_k": 5})
+    with patch(KB_CLASS, return_value=_StubRetriever(mock_ret_a)):
+        sa = await client.post("/api/v1/kb/search", headers=ha, json=_KB_QUERY)
         assert sa.status_code == 200
 
-    inst_b = type("MockRetriever", (), {"search": lambda self, **kw: mock_ret_b})()
-    with patch(KB_CLASS, return_value=inst_b):
-        sb = await client.post("/api/v1/kb/search", headers=hb, json={"query": "policy", "top_k": 5})
+    with patch(KB_CLASS, return_value=_StubRetriever(mock_ret_b)):
+        sb = await client.post("/api/v1/kb/search", headers=hb, json=_KB_QUERY)
         assert sb.status_code == 200
@@ -2,147 +2,140 @@
 Usage Tracking Tests
 測試使用量追蹤與計費統計
 """
+from types import MappingProxyType
+
 import pytest
 from httpx import AsyncClient
-from unittest.mock import patch, AsyncMock
-from tests.conftest import create_tenant, create_user, login_user
+from unittest.mock import patch
+from tests.conftest import StubOrchestrator, gather_settled, j
 
 CHAT_URL = "/api/v1/chat/chat"
 ORCH_CLASS = "app.api.v1.endpoints.chat.ChatOrchestrator"
 
 
-def _mock_orchestrator(**overrides):
-    result = {
-        "request_id": "r-usage", "question": "q", "answer": "a",
-        "company_policy": None, "labor_law": None,
-        "sources": [], "notes": [], "disclaimer": "僅供參考",
-    }
-    result.update(overrides)
-    inst = AsyncMock()
-    inst.process_query = AsyncMock(return_value=result)
-    return patch(ORCH_CLASS, return_value=inst)
-
-
-async def _setup_tenant_owner(client, superuser_headers, suffix):
-    t = await create_tenant(client, superuser_headers, {
-        "name": f"Usage {suffix}", "tax_id": f"U{suffix}",
-        "contact_name": suffix, "contact_email": f"c@{suffix}.com",
-        "contact_phone": f"091{suffix}111",
-    })
-    await create_user(client, superuser_headers, {
-        "email": f"owner@{suffix}.com", "password": "Owner123!",
-        "full_name": f"Owner {suffix}", "role": "owner",
-        "tenant_id": t["id"],
-    })
-    h = await login_user(client, f"owner@{suffix}.com", "Owner123!")
-    return t, h
+# 唯讀：chat 端點只讀取結果，所有呼叫共用同一份
+_MOCK_RESULT = MappingProxyType({
+    "request_id": "r-usage", "question": "q", "answer": "a",
+    "company_policy": None, "labor_law": None,
+    "sources": [], "notes": [], "disclaimer": "僅供參考",
+})
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _patched_orchestrator():
+    """整個模組只 patch 一次 ChatOrchestrator"""
+    with patch(ORCH_CLASS, return_value=StubOrchestrator(_MOCK_RESULT)):
+        yield
+
+
+@pytest.fixture(scope="module")
+def usage_tenant(seed_tenant_users):
+    """整個模組共用一個租戶（owner + employee）；每個測試寫入的用量隨 SAVEPOINT 回滾"""
+    _, headers = seed_tenant_users("USG01", roles=("owner", "employee"), name="Usage Co")
+    return headers
 
 
 @pytest.mark.asyncio
-async def test_usage_tracking_token_counts(client: AsyncClient, superuser_headers: dict):
+async def test_usage_tracking_token_counts(client: AsyncClient, usage_tenant: dict):
     """測試 token 用量是否正確追蹤"""
-    _, h = await _setup_tenant_owner(client, superuser_headers, "tok")
+    h = usage_tenant["owner"]
 
-    with _mock_orchestrator():
-        r = await client.post(CHAT_URL, headers=h, json={"question": "token test"})
-        assert r.status_code == 200
+    r = await client.post(CHAT_URL, headers=h, json={"question": "token test"})
+    assert r.status_code == 200
 
     summary = await client.get("/api/v1/audit/usage/summary", headers=h)
     assert summary.status_code == 200
-    data = summary.json()
+    data = j(summary)
     assert isinstance(data, (dict, list))
 
 
 @pytest.mark.asyncio
-async def test_usage_tracking_pinecone_queries(client: AsyncClient, superuser_headers: dict):
+async def test_usage_tracking_pinecone_queries(client: AsyncClient, usage_tenant: dict):
     """測試向量資料庫查詢次數追蹤"""
-    _, h = await _setup_tenant_owner(client, superuser_headers, "pin")
+    h = usage_tenant["owner"]
 
-    with _mock_orchestrator():
-        for i in range(3):
-            r = await client.post(CHAT_URL, headers=h, json={"question": f"pinecone q{i}"})
-            assert r.status_code == 200
+    results = await gather_settled(*(
+        client.post(CHAT_URL, headers=h, json={"question": f"pinecone q{i}"}) for i in range(3)
+    ))
+    assert [r.status_code for r in results] == [200] * 3
 
     summary = await client.get("/api/v1/audit/usage/summary", headers=h)
     assert summary.status_code == 200
 
 
 @pytest.mark.asyncio
-async def test_usage_cost_estimation(client: AsyncClient, superuser_headers: dict):
+async def test_usage_cost_estimation(client: AsyncClient, usage_tenant: dict):
     """測試使用成本估算"""
-    _, h = await _setup_tenant_owner(client, superuser_headers, "cost")
+    h = usage_tenant["owner"]
 
-    with _mock_orchestrator():
-        await client.post(CHAT_URL, headers=h, json={"question": "cost test"})
+    await client.post(CHAT_URL, headers=h, json={"question": "cost test"})
 
     summary = await client.get("/api/v1/audit/usage/summary", headers=h)
     assert summary.status_code == 200
-    data = summary.json()
+    data = j(summary)
     if isinstance(data, dict) and "total_cost" in data:
         assert isinstance(data["total_cost"], (int, float))
 
 
 @pytest.mark.asyncio
-async def test_usage_aggregation_by_action_type(client: AsyncClient, superuser_headers: dict):
+async def test_usage_aggregation_by_action_type(client: AsyncClient, usage_tenant: dict):
     """測試依動作類型彙總用量"""
-    _, h = await _setup_tenant_owner(client, superuser_headers, "agg")
+    h = usage_tenant["owner"]
 
-    with _mock_orchestrator():
-        await client.post(CHAT_URL, headers=h, json={"question": "q1"})
+    await client.post(CHAT_URL, headers=h, json={"question": "q1"})
 
-    with patch("app.tasks.document_tasks.process_document_task.delay") as mt:
-        mt.return_value.id = "t-agg"
-        await client.post(
-            "/api/v1/documents/upload", headers=h,
-            files={"file": ("agg.txt", b"some text", "text/plain")},
-        )
+    await client.post(
+        "/api/v1/documents/upload", headers=h,
+        files={"file": ("agg.txt", b"some text", "text/plain")},
+    )
 
     logs = await client.get("/api/v1/audit/logs", headers=h)
     assert logs.status_code == 200
-    data = logs.json()
+    data = j(logs)
     if data:
         types = {l.get("action_type") for l in data}
         assert len(types) >= 1
 
 
 @pytest.mark.asyncio
-async def test_usage_time_range_filtering(client: AsyncClient, superuser_headers: dict):
+@pytest.mark.parametrize("params, has_actions", [
+    (None, True),
+    ({"start_date": "2020-01-01", "end_date": "2099-12-31"}, True),
+    ({"start_date": "2099-01-01", "end_date": "2099-12-31"}, False),
+], ids=["no-range", "wide", "future"])
+async def test_usage_time_range_filtering(client: AsyncClient, usage_tenant: dict, params, has_actions):
     """測試依時間範圍篩選用量"""
-    _, h = await _setup_tenant_owner(client, superuser_headers, "time")
+    h = usage_tenant["owner"]
 
-    with _mock_orchestrator():
-        await client.post(CHAT_URL, headers=h, json={"question": "time q"})
+    await client.post(CHAT_URL, headers=h, json={"question": "time q"})
 
-    r = await client.get(
-        "/api/v1/audit/usage/summary",
-        headers=h,
-        params={"start_date": "2020-01-01", "end_date": "2099-12-31"},
-    )
+    r = await client.get("/api/v1/audit/usage/summary", headers=h, params=params)
     assert r.status_code == 200
+    total = j(r)["total_actions"]
+    # 剛送出的查詢落在範圍內才會被計入
+    if has_actions:
+        assert total >= 1
+    else:
+        assert total == 0
 
 
 @pytest.mark.asyncio
-async def test_multi_user_usage_attribution(client: AsyncClient, superuser_headers: dict):
+async def test_multi_user_usage_attribution(client: AsyncClient, usage_tenant: dict):
     """測試多用戶用量歸屬"""
-    t, h_owner = await _setup_tenant_owner(client, superuser_headers, "musr")
-
-    await create_user(client, superuser_headers, {
-        "email": "emp@musr.com", "password": "Emp123!",
-        "full_name": "Emp MUSR", "role": "employee",
-        "tenant_id": t["id"],
-    })
-    h_emp = await login_user(client, "emp@musr.com", "Emp123!")
+    h_owner, h_emp = usage_tenant["owner"], usage_tenant["employee"]
 
-    with _mock_orchestrator():
-        await client.post(CHAT_URL, headers=h_owner, json={"question": "owner q"})
-        await client.post(CHAT_URL, headers=h_emp, json={"question": "emp q"})
+    await gather_settled(
+        client.post(CHAT_URL, headers=h_owner, json={"question": "owner q"}),
+        client.post(CHAT_URL, headers=h_emp, json={"question": "emp q"}),
+    )
 
-    summary = await client.get("/api/v1/audit/usage/summary", headers=h_owner)
+    summary, logs = await gather_settled(
+        client.get("/api/v1/audit/usage/summary", headers=h_owner),
+        client.get("/api/v1/audit/logs", headers=h_owner),
+    )
     assert summary.status_code == 200
-
-    logs = await client.get("/api/v1/audit/logs", headers=h_owner)
     assert logs.status_code == 200
-    data = logs.json()
+    data = j(logs)
     if data:
         user_ids = {l.get("actor_user_id") for l in data}
         assert len(user_ids) >= 1